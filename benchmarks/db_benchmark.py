@@ -0,0 +1,187 @@
+"""Benchmark of librescada_utils.db_utils.database
+
+The operation_data collection of a benchmark database is filled with synthetic
+1 Hz data (--days days of --variables variables) and the main queries are timed:
+bulk insert, get_data (cold and cached, raw and downsampled), get_test_days
+(scanning the collection and from the daily summary), rebuild_summary and
+check_available_variables.
+For every scenario the throughput (rows/s and MB/s), the RSS of the process
+after it and its change during the scenario are reported, results can be
+written as JSON with --json.
+
+Backends:
+    · mongod: a running server given by --connection-string (the benchmark database is dropped at the end)
+    · inmemory: a temporary mongod started with pymongo_inmemory
+
+Usage:
+    python benchmarks/db_benchmark.py --days 7 --variables 50 --json results.json
+    python benchmarks/db_benchmark.py --backend inmemory --days 1 --variables 10
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import logging
+import os
+import platform
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bson
+import numpy as np
+
+from librescada_utils import db_utils
+
+DATABASE_NAME = 'librescada_benchmark'
+COLLECTION_NAME = 'operation_data'
+
+
+def rss_mb():
+    """Current resident set size of the process in MB, None if not available (no /proc)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024**2
+    except OSError:
+        return None
+
+def synthetic_samples(start:datetime.datetime, days:float, variables:list, seed:int=0):
+    """Generate 1 Hz samples one hour at a time, random walks around different levels"""
+    rng = np.random.default_rng(seed)
+    levels = rng.uniform(0, 100, len(variables))
+
+    for hour in range(int(days * 24)):
+        values = levels + np.cumsum(rng.normal(0, 0.1, (3600, len(variables))), axis=0)
+        levels = values[-1]
+        hour_start = start + datetime.timedelta(hours=hour)
+        yield [{'time': hour_start + datetime.timedelta(seconds=second), **dict(zip(variables, row))}
+               for second, row in enumerate(values.tolist())]
+
+@contextlib.contextmanager
+def backend_connection(args):
+    """Connection string of the selected backend"""
+    if args.backend == 'mongod':
+        # Start from an empty benchmark database
+        db_utils.get_mongo_client(args.connection_string).drop_database(DATABASE_NAME)
+        yield args.connection_string
+
+    elif args.backend == 'inmemory':
+        from pymongo_inmemory import Mongod
+        with Mongod() as mongod:
+            yield mongod.connection_string
+
+    else:
+        raise ValueError(f'Backend {args.backend} not supported, options are: mongod, inmemory')
+
+def run_scenario(results:dict, name:str, func, rows=None, nbytes=None):
+    """Time func, rows and nbytes are either numbers or functions of its result"""
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    try:
+        result = func()
+    except Exception as e:
+        results[name] = {'error': f'{type(e).__name__}: {e}'}
+        print(f'  {name:<32} {results[name]["error"]}', flush=True)
+        return None
+    elapsed = time.perf_counter() - start
+    rss_after = rss_mb()
+
+    rows = rows(result) if callable(rows) else rows
+    nbytes = nbytes(result) if callable(nbytes) else nbytes
+    results[name] = {
+        'time_s': elapsed,
+        'rows': rows,
+        'rows_per_s': rows / elapsed if rows is not None else None,
+        'mb_per_s': nbytes / 1024**2 / elapsed if nbytes is not None else None,
+        'rss_mb': rss_after,
+        'rss_delta_mb': rss_after - rss_before if rss_after is not None else None,
+    }
+    print(f'  {name:<32} {elapsed*1000:10.1f} ms'
+          + (f' {results[name]["rows_per_s"]:12.0f} rows/s' if rows is not None else '')
+          + (f' {results[name]["mb_per_s"]:8.1f} MB/s' if nbytes is not None else '')
+          + (f'  RSS {rss_after:.0f} MB ({results[name]["rss_delta_mb"]:+.0f} MB)' if rss_after is not None else ''),
+          flush=True)
+
+    return result
+
+def dataframe_rows(data):
+    return len(data)
+
+def dataframe_bytes(data):
+    return data.memory_usage(deep=True).sum()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', type=str, default='mongod', choices=['mongod', 'inmemory'])
+    parser.add_argument('--connection-string', type=str, default='mongodb://localhost:27017')
+    parser.add_argument('--days', type=float, default=2, help='Days of 1 Hz data (whole hours)')
+    parser.add_argument('--variables', type=int, default=20, help='Number of variables per sample')
+    parser.add_argument('--json', type=str, default=None, help='Write the results to this file')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    variables = [f'TT-BEN-{i:03d}' for i in range(args.variables)]
+    start = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+    end = start + datetime.timedelta(hours=int(args.days * 24))
+    last_day = max(start, end - datetime.timedelta(days=1))
+
+    results = {
+        'meta': {'backend': args.backend, 'days': args.days, 'variables': args.variables,
+                 'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                 'python': platform.python_version(), 'platform': platform.platform()},
+        'results': {},
+    }
+    scenarios = results['results']
+
+    with backend_connection(args) as connection_string:
+        # The summary is built explicitly by the rebuild_summary scenario
+        db = db_utils.database(connection_string, DATABASE_NAME, COLLECTION_NAME, create_if_not_exist=True,
+                               build_summary=False)
+        if not db.isConnected:
+            sys.exit(f'Could not connect to {connection_string}')
+        try:
+            # Bulk insert, one hour of samples per write_samples call (in write_batch_size batches)
+            sample_bytes = len(bson.encode(next(synthetic_samples(start, 1, variables))[0]))
+            n_rows = int(args.days * 24) * 3600
+
+            def insert():
+                for samples in synthetic_samples(start, args.days, variables):
+                    for idx in range(0, len(samples), db.write_batch_size):
+                        db.write_samples(samples[idx:idx+db.write_batch_size])
+            print(f'Inserting {n_rows} samples of {args.variables} variables', flush=True)
+            run_scenario(scenarios, 'insert', insert, rows=n_rows, nbytes=n_rows*sample_bytes)
+
+            # Daily summary, days are first scanned from the collection, then the summary is built and read
+            db.summary_col.delete_many({})
+            run_scenario(scenarios, 'get_test_days_scan', db.get_test_days, rows=len)
+            run_scenario(scenarios, 'rebuild_summary', db.rebuild_summary, rows=n_rows)
+            run_scenario(scenarios, 'get_test_days', db.get_test_days, rows=len)
+            run_scenario(scenarios, 'check_available_variables', lambda: db.check_available_variables(last_day.date()))
+
+            # One day of all the variables
+            db.data_cache.clear()
+            run_scenario(scenarios, 'get_data_day_cold', lambda: db.get_data(last_day, end, vars=variables),
+                         rows=dataframe_rows, nbytes=dataframe_bytes)
+            run_scenario(scenarios, 'get_data_day_cached', lambda: db.get_data(last_day, end, vars=variables),
+                         rows=dataframe_rows, nbytes=dataframe_bytes)
+            # The whole period
+            db.data_cache.clear()
+            run_scenario(scenarios, 'get_data_all_cold', lambda: db.get_data(start, end, vars=variables),
+                         rows=dataframe_rows, nbytes=dataframe_bytes)
+            run_scenario(scenarios, 'get_data_downsampled_1min', lambda: db.get_data(start, end, vars=variables, resolution='1min'),
+                         rows=dataframe_rows, nbytes=dataframe_bytes)
+
+        finally:
+            db.close_writer()
+            with contextlib.suppress(Exception):
+                db.db_client.drop_database(DATABASE_NAME)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Import time benchmark of librescada_utils
+
+Every scenario is imported in a fresh interpreter, measuring the import time,
+the peak RSS and which heavy dependencies ended up loaded. The command fails
+if a scenario loads a dependency it should not, so it can be run in CI to
+keep the package lazy.
+
+Usage:
+    python benchmarks/import_time.py [--repeat 5] [--json results.json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HEAVY_MODULES = ['aiohttp', 'asyncio', 'asyncua', 'pymongo', 'pandas', 'numpy', 'pyarrow', 'librescada']
+
+# Import statement: dependencies that must not be loaded by it
+SCENARIOS = {
+    'import librescada_utils': ['aiohttp', 'asyncua', 'pymongo', 'pandas', 'numpy', 'librescada'],
+    'from librescada_utils import argparser_librescada, generate_groups': ['aiohttp', 'asyncua', 'pymongo', 'pandas', 'numpy', 'librescada'],
+    'from librescada_utils import get_logger_librescada, api_logging_handler': ['aiohttp', 'asyncua', 'pymongo', 'pandas', 'numpy', 'librescada'],
+    'from librescada_utils.buffer_utils import ring_buffer': ['aiohttp', 'asyncua', 'pymongo', 'pandas', 'librescada'],
+    'from librescada_utils.db_utils import database': ['aiohttp', 'asyncua', 'librescada'],
+    'from librescada_utils.opc_utils import uaclient_librescada': ['aiohttp', 'pymongo', 'pandas', 'numpy', 'librescada'],
+}
+
+PROBE = """
+import sys, time, resource
+t = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - t
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print({{'time_ms': elapsed*1000, 'max_rss_mb': rss/1024, 'loaded': [m for m in {heavy!r} if m in sys.modules]}})
+"""
+
+def run_scenario(statement:str, repeat:int=5) -> dict:
+    """Import statement repeat times in new interpreters, returns the fastest run"""
+    repo_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([repo_dir, os.environ.get('PYTHONPATH', '')]))
+
+    runs = []
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, '-c', PROBE.format(statement=statement, heavy=HEAVY_MODULES)],
+                                capture_output=True, text=True, env=env)
+        if result.returncode != 0:
+            return {'error': result.stderr.strip().splitlines()[-1]}
+        runs.append(eval(result.stdout.strip().splitlines()[-1]))
+
+    return min(runs, key=lambda run: run['time_ms'])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per scenario, the fastest is reported')
+    parser.add_argument('--json', type=str, default=None, help='Write the results to this file')
+    args = parser.parse_args()
+
+    results = {}; failed = False
+    for statement, forbidden in SCENARIOS.items():
+        result = run_scenario(statement, repeat=args.repeat)
+
+        if 'error' in result:
+            # Missing optional dependency (e.g. pymongo not installed), not a regression
+            print(f'{statement:<75} skipped: {result["error"]}')
+        else:
+            result['unexpected'] = [m for m in result['loaded'] if m in forbidden]
+            failed |= bool(result['unexpected'])
+            print(f'{statement:<75} {result["time_ms"]:8.1f} ms {result["max_rss_mb"]:7.1f} MB  '
+                  f'loaded: {", ".join(result["loaded"]) or "-"}'
+                  + (f'  UNEXPECTED: {", ".join(result["unexpected"])}' if result['unexpected'] else ''))
+        results[statement] = result
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    sys.exit(1 if failed else 0)
+
+if __name__ == '__main__':
+    main()
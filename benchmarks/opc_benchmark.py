@@ -0,0 +1,250 @@
+"""Benchmark of the hot paths of librescada_utils.opc_utils
+
+A local asyncua server is started in a background thread and populated with
+the layout used in librescada:
+
+    Objects:
+        · measurements: sensors in folders of --folder-size tags
+        · inputs: inputs (10% of the tags)
+        · controllers: one folder per controller with online, active and parameters
+
+For every scale (number of tags) get_server_structure (browsing and from the
+on-disk cache), find_nodes, read_values, write_values, setup_object and
+opcua_server_configuration are timed and the results written as JSON, so
+two runs (e.g. two commits) can be compared with --compare.
+
+Usage:
+    python benchmarks/opc_benchmark.py --scales 100,1000,10000 --json results.json
+    python benchmarks/opc_benchmark.py --scales 100,1000 --compare results.json
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from asyncua import Server
+
+from librescada_utils import generate_groups
+from librescada_utils import opc_utils
+
+URI = 'urn:librescada:benchmark'
+CONTROLLER_PARAMETERS = ['online', 'active', 'Kp', 'Ki', 'Kd', 'setpoint']
+
+
+def tag_names(n_tags:int) -> dict:
+    """Names of the tags of each object for a total of n_tags"""
+    n_inputs = max(1, n_tags // 10)
+    n_controllers = max(1, n_tags // 20 // len(CONTROLLER_PARAMETERS))
+    n_measurements = max(1, n_tags - n_inputs - n_controllers*len(CONTROLLER_PARAMETERS))
+
+    return {
+        'measurements': [f'TT-BEN-{i:05d}' for i in range(n_measurements)],
+        'inputs': [f'FC-BEN-{i:05d}' for i in range(n_inputs)],
+        'controllers': [f'controller_{i:03d}' for i in range(n_controllers)],
+    }
+
+async def populate_server(server:Server, names:dict, folder_size:int):
+    idx = await server.register_namespace(URI)
+    objects = server.nodes.objects
+
+    measurements = await objects.add_object(idx, 'measurements')
+    for start in range(0, len(names['measurements']), folder_size):
+        folder = await measurements.add_folder(idx, f'folder_{start // folder_size:03d}')
+        for name in names['measurements'][start:start+folder_size]:
+            await (await folder.add_variable(idx, name, 0.0)).set_writable()
+
+    inputs = await objects.add_object(idx, 'inputs')
+    for name in names['inputs']:
+        await (await inputs.add_variable(idx, name, 0.0)).set_writable()
+
+    controllers = await objects.add_object(idx, 'controllers')
+    for controller in names['controllers']:
+        folder = await controllers.add_folder(idx, controller)
+        for parameter in CONTROLLER_PARAMETERS:
+            await folder.add_variable(idx, parameter, 0.0)
+
+class server_thread():
+    """asyncua server running in its own thread and event loop"""
+
+    def __init__(self, port:int, names:dict, folder_size:int):
+        self.url = f'opc.tcp://127.0.0.1:{port}/'
+        self.names = names
+        self.folder_size = folder_size
+        self._ready = threading.Event()
+        self._stop = threading.Event()
+        self._error = None
+        self._thread = threading.Thread(target=lambda: asyncio.run(self._run()), daemon=True)
+
+    async def _run(self):
+        try:
+            server = Server()
+            await server.init()
+            server.set_endpoint(self.url)
+            await populate_server(server, self.names, self.folder_size)
+            await server.start()
+        except Exception as e:
+            self._error = e
+            self._ready.set()
+            return
+
+        self._ready.set()
+        while not self._stop.is_set():
+            await asyncio.sleep(0.05)
+        await server.stop()
+
+    def __enter__(self):
+        self._thread.start()
+        self._ready.wait()
+        if self._error:
+            raise self._error
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+async def timeit(func, repeat:int) -> dict:
+    """Run the coroutine function func repeat times, returns timing statistics in ms"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        times.append((time.perf_counter() - start) * 1000)
+
+    return {'min_ms': min(times), 'median_ms': statistics.median(times),
+            'mean_ms': statistics.fmean(times), 'runs': len(times)}
+
+async def run_scale(n_tags:int, args) -> dict:
+    names = tag_names(n_tags)
+    cache_dir = tempfile.mkdtemp(prefix='librescada_benchmark_')
+    ua_parameters = {'url': None, 'url_local': None, 'uri': URI, 'structure_cache_dir': cache_dir,
+                     'cache_structure': True}
+    results = {'tags': sum(len(v) for v in names.values()) + len(names['controllers'])*(len(CONTROLLER_PARAMETERS)-1)}
+
+    start = time.perf_counter()
+    with server_thread(args.port, names, args.folder_size) as server:
+        results['populate_s'] = time.perf_counter() - start
+        ua_parameters['url'] = ua_parameters['url_local'] = server.url
+
+        client = await opc_utils.uaclient_librescada.create(ua_parameters, local=True)
+        await client.connect()
+        try:
+            async def benchmark(name, func, repeat=args.repeat):
+                try:
+                    results[name] = await timeit(func, repeat)
+                except Exception as e:
+                    results[name] = {'error': f'{type(e).__name__}: {e}'}
+                print(f'  {name:<36} ' + (f'{results[name]["median_ms"]:10.1f} ms' if 'error' not in results[name]
+                                          else results[name]['error']), flush=True)
+
+            await benchmark('get_server_structure_browse', lambda: client.get_server_structure(refresh=True))
+            await benchmark('get_server_structure_cached', lambda: client.get_server_structure())
+
+            measurements = names['measurements']
+            await benchmark('find_nodes', lambda: client.find_nodes(measurements, object='measurements', log=False))
+
+            nodes = await client.find_nodes(measurements, object='measurements', log=False)
+            values = [float(i) for i in range(len(nodes))]
+            await benchmark('read_values', lambda: client.read_values(nodes))
+            await benchmark('write_values', lambda: client.write_values(nodes, values))
+
+            def object_config():
+                return {'name': 'benchmark_object', 'children': {
+                    **{f'var_{i:04d}': {'type': 'float', 'value': 1.0} for i in range(args.object_size)},
+                    'folder': {'type': 'folder', 'children': {f'sub_{i:04d}': {'type': 'int'} for i in range(args.object_size)}},
+                }}
+            await benchmark('setup_object', lambda: client.setup_object(object_config()))
+
+        finally:
+            await client.disconnect()
+
+        # Blocking API, run in a thread as the services using it do
+        config = {
+            'ua_parameters': {**ua_parameters, 'structure_cache_dir': tempfile.mkdtemp(prefix='librescada_benchmark_')},
+            'monitoring': {'maxLen': 100},
+            'measurements': {name: {'sensor_id': name, 'var_id': name, 'group': f'group_{idx % 10}'}
+                             for idx, name in enumerate(measurements)},
+        }
+        groups, _ = generate_groups(config)
+
+        def configure():
+            opc_client, _, _ = opc_utils.opcua_server_configuration(config, groups, log=False, secure=False, local=True)
+            opc_client.disconnect()
+
+        # First run browses the server, next ones load the structure from the cache
+        await benchmark('opcua_server_configuration_cold', lambda: asyncio.to_thread(configure), repeat=1)
+        await benchmark('opcua_server_configuration', lambda: asyncio.to_thread(configure))
+
+    return results
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def compare(results:dict, baseline:dict, threshold:float, min_delta_ms:float=1.0) -> bool:
+    """Print the ratio of every median against the baseline, returns True if any
+        is above threshold (and slower by more than min_delta_ms, to ignore noise)"""
+    regression = False
+    for scale, scale_results in results['results'].items():
+        for name, result in scale_results.items():
+            base = baseline.get('results', {}).get(scale, {}).get(name)
+            if not isinstance(result, dict) or 'median_ms' not in result or not base or 'median_ms' not in base:
+                continue
+            ratio = result['median_ms'] / base['median_ms']
+            flag = ' REGRESSION' if ratio > threshold and result['median_ms'] - base['median_ms'] > min_delta_ms else ''
+            regression |= bool(flag)
+            print(f'{scale:>6} {name:<36} {base["median_ms"]:10.1f} -> {result["median_ms"]:10.1f} ms  x{ratio:.2f}{flag}')
+
+    return regression
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=str, default='100,1000,10000', help='Comma separated number of tags')
+    parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement')
+    parser.add_argument('--folder-size', type=int, default=100, help='Tags per folder in measurements')
+    parser.add_argument('--object-size', type=int, default=50, help='Variables per level in setup_object')
+    parser.add_argument('--port', type=int, default=48480)
+    parser.add_argument('--json', type=str, default=None, help='Write the results to this file')
+    parser.add_argument('--compare', type=str, default=None, help='Baseline results to compare with')
+    parser.add_argument('--threshold', type=float, default=1.2, help='Ratio over the baseline considered a regression')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='Smaller slowdowns are not considered regressions')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.ERROR)
+
+    results = {
+        'meta': {'commit': git_commit(), 'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                 'python': platform.python_version(), 'platform': platform.platform(),
+                 'asyncua': getattr(sys.modules['asyncua'], '__version__', None), 'repeat': args.repeat},
+        'results': {},
+    }
+    for scale in [int(scale) for scale in args.scales.split(',')]:
+        print(f'{scale} tags', flush=True)
+        results['results'][str(scale)] = await run_scale(scale, args)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(results, baseline, args.threshold, args.min_delta_ms) else 0)
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -1,57 +1,312 @@
-import copy
 import logging
 import os
 import re
 import time
 import argparse
+import threading
+import functools
+from collections import deque, OrderedDict
+from collections.abc import Mapping, ItemsView
 # import requests
-import aiohttp
-import asyncio
+# aiohttp, asyncio and numpy are imported where needed, so tools that only use 
+# e.g. argparser_librescada or generate_groups do not pay for them (see __getattr__)
 
 
 logger = logging.getLogger(__name__)
+# Errors of api_logging_handler itself, never sent back to the API
+api_handler_logger = logging.getLogger(f'{__name__}.api_logging_handler')
 
 class api_logging_handler(logging.Handler):
     """Custom log handler to send log messages and alerts to API
 
+        emit only queues the record, a background thread with its own event loop 
+        owns the aiohttp session and sends the queued alerts every batch_interval 
+        seconds, retrying with exponential backoff on connection errors, 5xx and 429. 
+        Other non-2xx responses are not retried. It works with or without a running 
+        event loop and never blocks the caller.
+        
+        By default every alert is sent as a single object per POST (the format the 
+        API has always received, with the number of coalesced alerts prepended to the 
+        message). With batch=True the alerts are sent as a list of up to max_batch 
+        alerts in one POST, each with a count field, for endpoints that accept it.
+
+        The queue is bounded to max_queue alerts, on overflow:
+            - 'coalesce': an alert identical (level, source and message) to a queued one 
+              increments its count, otherwise the oldest alert is dropped
+            - 'drop': the new alert is dropped
+
     Args:
-        logging (_type_): _description_
+        api_url (str): Endpoint that receives the alerts
+        batch (bool, optional): Send a list of alerts per POST. Defaults to False.
+        batch_interval (float, optional): Seconds between POSTs. Defaults to 1.
+        max_queue (int, optional): Maximum number of queued alerts. Defaults to 1000.
+        max_batch (int, optional): Maximum number of alerts per POST. Defaults to 100.
+        overflow (str, optional): 'coalesce' or 'drop'. Defaults to 'coalesce'.
+        max_retries (int, optional): Retries of a failed POST. Defaults to 3.
+        backoff (float, optional): Initial delay between retries in seconds, doubled every retry. Defaults to 0.5.
     """
 
-    def __init__(self, api_url):
-        # Initialize logger
-        self.session = aiohttp.ClientSession()
+    def __init__(self, api_url, batch=False, batch_interval=1.0, max_queue=1000, max_batch=100, 
+                 overflow='coalesce', max_retries=3, backoff=0.5):
         logging.Handler.__init__(self)
+        
+        if overflow not in ['coalesce', 'drop']:
+            raise ValueError(f'Unsupported overflow policy {overflow}, options are: coalesce, drop')
 
         # Set API url
         self.api_url = api_url
-
-    async def send_request(self, alert_data):
-        # Use async version of requests to send the HTTP request
-        try:
-            async with self.session.post(self.api_url, json=alert_data) as resp:
-                pass
-        except Exception as e:
-            # Log any exceptions as warnings in the stream handler
-            logging.warning(f"Failed to send log message to API: {e}")
+        self.batch = batch
+        self.batch_interval = batch_interval
+        self.max_queue = max_queue
+        self.max_batch = max_batch
+        self.overflow = overflow
+        self.max_retries = max_retries
+        self.backoff = backoff
+        
+        self.stats = {'sent': 0, 'coalesced': 0, 'dropped': 0, 'failed': 0}
+        
+        self._queue = deque()
+        self._queued = {} # (level, source, message) -> queued alert, used to coalesce
+        self._queue_lock = threading.Lock()
+        self._event = threading.Event()
+        self._worker = None
+        self._stop = False
 
     def emit(self, log_record):
-        # Every time the logger is called it will format the message and send it to the API
+        # Every time the logger is called it will format the message and queue it to be sent to the API
+        
+        # Errors of the handler itself are not sent back, nothing is queued once closed
+        if log_record.name == api_handler_logger.name or self._stop:
+            return
 
         alert_data = {
             "level": log_record.levelname,
             "title": "hola",
-            "message": log_record.msg,
+            "message": log_record.getMessage(),
             "source": log_record.name,
+            "count": 1,
         }
+        key = (alert_data['level'], alert_data['source'], alert_data['message'])
+        
+        with self._queue_lock:
+            if len(self._queue) >= self.max_queue:
+                if self.overflow == 'drop':
+                    self.stats['dropped'] += 1
+                    return
+                
+                if key in self._queued:
+                    self._queued[key]['count'] += 1
+                    self.stats['coalesced'] += 1
+                    return
+                
+                oldest = self._queue.popleft()
+                self._forget(oldest)
+                self.stats['dropped'] += 1
+                
+            self._queue.append(alert_data)
+            self._queued[key] = alert_data
+            
+        if self._worker is None:
+            self._start_worker()
+            
+    def _forget(self, alert_data):
+        key = (alert_data['level'], alert_data['source'], alert_data['message'])
+        if self._queued.get(key) is alert_data:
+            del self._queued[key]
+            
+    def _next_batch(self) -> list:
+        with self._queue_lock:
+            batch = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            for alert_data in batch:
+                self._forget(alert_data)
+                
+        return batch
+            
+    def _start_worker(self):
+        with self._queue_lock:
+            if self._worker is not None or self._stop:
+                return
+            import asyncio
+            self._worker = threading.Thread(target=lambda: asyncio.run(self._worker_loop()), 
+                                            daemon=True, name='api_logging_handler')
+            self._worker.start()
+
+    async def send_request(self, session, payload, n_alerts=1) -> bool:
+        # Send one alert or a list of alerts, retrying transient errors with exponential backoff
+        import asyncio
+        
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with session.post(self.api_url, json=payload) as resp:
+                    if 200 <= resp.status < 300:
+                        return True
+                    error = f'HTTP {resp.status}: {(await resp.text())[:200]}'
+                    if resp.status < 500 and resp.status != 429:
+                        break
+            except Exception as e:
+                error = e
+                
+            if attempt < self.max_retries:
+                await asyncio.sleep(self.backoff * 2**attempt)
+                
+        # Log any errors as warnings in the stream handler
+        api_handler_logger.warning(f"Failed to send {n_alerts} log messages to API: {error}")
+        return False
+    
+    @staticmethod
+    def _single_alert(alert_data) -> dict:
+        alert_data = dict(alert_data)
+        count = alert_data.pop('count')
+        if count > 1:
+            alert_data['message'] = f'[{count} times] {alert_data["message"]}'
+            
+        return alert_data
+    
+    async def _worker_loop(self):
+        import aiohttp
+        
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
+            while True:
+                # The event loop is only used by this worker, it can wait blocking
+                self._event.wait(timeout=self.batch_interval)
+                self._event.clear()
+                stop = self._stop
+                
+                while batch := self._next_batch():
+                    if self.batch:
+                        sent = await self.send_request(session, batch, len(batch))
+                        self.stats['sent' if sent else 'failed'] += len(batch)
+                        continue
+                    
+                    for alert_data in batch:
+                        sent = await self.send_request(session, self._single_alert(alert_data))
+                        self.stats['sent' if sent else 'failed'] += 1
+                    
+                if stop:
+                    break
+                
+    def flush(self):
+        """Wake up the worker to send the queued alerts now"""
+        self._event.set()
+
+    def close(self, timeout=5):
+        # Send the queued alerts and stop the worker (which closes the session)
+        self._stop = True
+        if self._worker is not None:
+            self._event.set()
+            self._worker.join(timeout=timeout)
+            self._worker = None
+        super().close()
 
-        # Use asyncio to run the send_request method asynchronously
-        asyncio.create_task(self.send_request(alert_data))
+class rate_limit_filter(logging.Filter):
+    """Deduplicate and rate limit repeated log records, e.g. alerts of a flapping sensor
 
-    def close(self):
-        # Close the session when the handler is closed
-        self.session.close()
-        super().close()
+        Records are identified by a fingerprint of logger name, level and message 
+        template (msg before formatting with args, so 'Sensor %s high' with different 
+        values counts as the same message). At most max_per_window records with the 
+        same fingerprint pass in any window of window seconds, the rest are suppressed 
+        and counted. The count is reported as a summary record once the burst is over 
+        (checked every summary_interval seconds by a timer while records are suppressed) 
+        or prepended to the next record that passes.
+        
+        State is kept for at most max_keys fingerprints (least recently used are 
+        forgotten), so memory is bounded in long running services.
+
+    Args:
+        window (float, optional): Sliding window in seconds. Defaults to 60.
+        max_per_window (int, optional): Records allowed per fingerprint and window. Defaults to 3.
+        summary_interval (float, optional): Seconds between checks for pending summaries. Defaults to 60.
+        max_keys (int, optional): Maximum number of fingerprints tracked. Defaults to 1024.
+        levels (set, optional): Levels of the records limited, others always pass. Defaults to None (all levels).
+    """
+    
+    def __init__(self, window=60, max_per_window=3, summary_interval=60, max_keys=1024, levels=None):
+        super().__init__()
+        
+        self.window = window
+        self.max_per_window = max_per_window
+        self.summary_interval = summary_interval
+        self.max_keys = max_keys
+        self.levels = frozenset(levels) if levels is not None else None
+        
+        self._state = OrderedDict() # fingerprint -> [deque of pass times, suppressed count, logger name, level, msg]
+        self._lock = threading.Lock()
+        self._timer = None # Checks for pending summaries while records are suppressed
+        
+    def filter(self, record) -> bool:
+        if getattr(record, 'rate_limit_summary', False) or (self.levels is not None and record.levelno not in self.levels):
+            return True
+        
+        now = time.monotonic()
+        key = (record.name, record.levelno, str(record.msg))
+        
+        with self._lock:
+            state = self._state.get(key)
+            if state is None:
+                state = [deque(maxlen=self.max_per_window), 0, record.name, record.levelno, str(record.msg)]
+                self._state[key] = state
+                if len(self._state) > self.max_keys:
+                    self._state.popitem(last=False)
+            else:
+                self._state.move_to_end(key)
+                
+            times = state[0]
+            while times and now - times[0] > self.window:
+                times.popleft()
+                
+            allowed = len(times) < self.max_per_window
+            if allowed:
+                times.append(now)
+                if state[1]:
+                    record.msg = f'[{state[1]} similar messages suppressed] {record.msg}'
+                    state[1] = 0
+            else:
+                state[1] += 1
+                if self._timer is None:
+                    self._schedule_check()
+            
+        return allowed
+    
+    def _schedule_check(self):
+        # Called with the lock held
+        self._timer = threading.Timer(self.summary_interval, self._check_summaries)
+        self._timer.daemon = True
+        self._timer.start()
+        
+    def _check_summaries(self):
+        with self._lock:
+            pending = self._pending_summaries(time.monotonic())
+            # Keep checking while some burst is still going on
+            if any(state[1] for state in self._state.values()):
+                self._schedule_check()
+            else:
+                self._timer = None
+                
+        self._log_summaries(pending)
+    
+    def _pending_summaries(self, now) -> list:
+        # Fingerprints with suppressed records whose burst is over (nothing passed in the last window)
+        pending = []
+        for state in self._state.values():
+            times = state[0]
+            if state[1] and (not times or now - times[-1] > self.window):
+                pending.append((state[2], state[3], state[4], state[1]))
+                state[1] = 0
+                
+        return pending
+    
+    def flush_summaries(self):
+        """Log the summaries of all the fingerprints with suppressed records now"""
+        with self._lock:
+            pending = self._pending_summaries(float('inf'))
+            
+        self._log_summaries(pending)
+        
+    @staticmethod
+    def _log_summaries(pending):
+        for name, level, msg, suppressed in pending:
+            logging.getLogger(name).log(level, '%d similar messages suppressed: %s', 
+                                        suppressed, msg, extra={'rate_limit_summary': True})
 
 class logger_librescada(logging.Logger):
     TELEGRAM_BOT = logging.INFO + 5
@@ -59,6 +314,10 @@ class logger_librescada(logging.Logger):
     def __init__(self, name, api_url=None):
         super(logger_librescada, self).__init__(name)
         
+        # Deduplicate / rate limit TELEGRAM_BOT records, see rate_limit_filter
+        self.rate_limiter = rate_limit_filter(levels={self.TELEGRAM_BOT})
+        self.addFilter(self.rate_limiter)
+        
         # # Define logging configuration parameters in a dictionary
         # config = {
         #     "level": logging.INFO,
@@ -255,9 +514,65 @@ def get_assets_dir(optional=False):
 #         self.requests.post(self.api_url, json=alert_data)
 
 
-def generate_groups(config, type='measurements'):
+def group_variables(variables:dict, group_key:str) -> dict:
+    """Group a dictionary of variables by the value of group_key in a single pass,
+        variable dictionaries are shared, not copied
+
+    Returns:
+        dict: {group_name: {var: variable}} with group names sorted
+    """
+    grouped = {}
+    for var, variable in variables.items():
+        grouped.setdefault(variable[group_key], {})[var] = variable
+        
+    return {name: grouped[name] for name in sorted(grouped)}
+
+def as_measurement(variable:dict) -> dict:
+    """Copy of an input with input_id and subsystem keys replaced by sensor_id 
+        and group to be consistent with measurements (shallow, values are shared)"""
+    variable = dict(variable)
+    variable['sensor_id'] = variable.pop('input_id')
+    variable['group'] = variable.pop('subsystem')
+    
+    return variable
+
+def groups_table(variables, uniqueGroupValues:list) -> dict:
+    """Columnar table of variables: var_id, sensor_id and group code (index 
+        in uniqueGroupValues) arrays, plus a var_id -> row index
+
+    Args:
+        variables (iterable): Variable dictionaries with var_id, sensor_id and group keys
+        uniqueGroupValues (list): Sorted group names
+
+    Returns:
+        dict: var_id, sensor_id (object arrays), group_code (int32 array), groups and index
+    """
+    import numpy as np
+    
+    group_codes = {name: code for code, name in enumerate(uniqueGroupValues)}
+    var_ids = []; sensor_ids = []; codes = []
+    for variable in variables:
+        var_ids.append(variable['var_id'])
+        sensor_ids.append(variable['sensor_id'])
+        codes.append(group_codes[variable['group']])
+        
+    return {
+        'var_id': np.array(var_ids, dtype=object),
+        'sensor_id': np.array(sensor_ids, dtype=object),
+        'group_code': np.array(codes, dtype=np.int32),
+        'groups': list(uniqueGroupValues),
+        'index': {var_id: row for row, var_id in enumerate(var_ids)},
+    }
+
+def generate_groups(config, type='measurements', table=False):
     """Generate groups of different structure depending on the type
         argument
+        
+        Variable dictionaries are shared with config (inputs are shallow copied 
+        in the grouped modes since their keys are renamed), do not modify them.
+        
+        If table is True, a columnar table (see groups_table) of the variables is 
+        also returned: groups, uniqueGroupValues, table
     """
     
     if type == 'measurements':
@@ -275,21 +590,17 @@ def generate_groups(config, type='measurements'):
         """
         
         # Create groups
-        groupValues = [config["measurements"][var]["group"] for var in config["measurements"].keys()]
-        uniqueGroupValues = list(set(groupValues))
-        uniqueGroupValues.sort()
-
-        groups = [{"name": grpName, "sensorId_list": None, "measurements": dict(), "varId_list":None} for grpName in uniqueGroupValues]
-                
-        for var in config["measurements"].keys():
-            grpIdx  = uniqueGroupValues.index(config["measurements"][var]["group"])
-            groups[grpIdx]["measurements"][var] = config["measurements"][var]
-            # print(group["measurements"].keys())
-
+        grouped = group_variables(config["measurements"], "group")
+        uniqueGroupValues = list(grouped)
+        
         # Create sensor_id and var_id list for each group
-        for grpIdx in range(len(groups)):
-            groups[grpIdx]["sensorId_list"] = [ groups[grpIdx]["measurements"][var]["sensor_id"] for var in groups[grpIdx]["measurements"].keys() ]
-            groups[grpIdx]["varId_list"]    = [ groups[grpIdx]["measurements"][var]["var_id"] for var in groups[grpIdx]["measurements"].keys() ]
+        groups = [{"name": grpName, 
+                   "sensorId_list": [var["sensor_id"] for var in measurements.values()], 
+                   "measurements": measurements, 
+                   "varId_list": [var["var_id"] for var in measurements.values()]} 
+                  for grpName, measurements in grouped.items()]
+        
+        variables = config["measurements"].values()
 
     elif type=='inputs':
         """
@@ -304,78 +615,42 @@ def generate_groups(config, type='measurements'):
             
         """
         # Create groups
-        groupValues = [config["inputs"][var]["subsystem"] for var in config["inputs"].keys()]
-        uniqueGroupValues = list(set(groupValues))
-        uniqueGroupValues.sort()
-
-        groups = [{"name": grpName, "id_list":None, "inputs": dict(), "varId_list":None} for grpName in uniqueGroupValues]
-                
-        for var in config["inputs"].keys():
-            grpIdx  = uniqueGroupValues.index(config["inputs"][var]["subsystem"])
-            groups[grpIdx]["inputs"][var] = config["inputs"][var]
-
-        # Create sensor_id and var_id list for each group
-        for grpIdx in range(len(groups)):
-            groups[grpIdx]["inputId_list"]  = [ groups[grpIdx]["inputs"][var]["input_id"] for var in groups[grpIdx]["inputs"].keys() ]
-            groups[grpIdx]["varId_list"]    = [ groups[grpIdx]["inputs"][var]["var_id"] for var in groups[grpIdx]["inputs"].keys() ]
-            
-    elif type=='grouped': # Used in data_export and data_visualization
-        """
-            Returns a dict with both measurements and inputs using sensor or input ids as keys.
-            input_id and subsystem keys are substituted by sensor_id and group keys to be consistent with measurements
-        """
+        grouped = group_variables(config["inputs"], "subsystem")
+        uniqueGroupValues = list(grouped)
+
+        # Create input_id and var_id list for each group
+        groups = [{"name": grpName, "id_list": None, "inputs": inputs, 
+                   "varId_list": [var["var_id"] for var in inputs.values()], 
+                   "inputId_list": [var["input_id"] for var in inputs.values()]} 
+                  for grpName, inputs in grouped.items()]
         
-        groups = {}
-        for var_id in config['measurements']:
-            var = config['measurements'][var_id]
-            groups[var['sensor_id']] = var
+        variables = [{"var_id": var["var_id"], "sensor_id": var["input_id"], "group": var["subsystem"]} 
+                     for var in config["inputs"].values()] if table else None
             
-        config_copy = copy.deepcopy(config['inputs']) # Copy since it's going to be modified
-        for var_id in config_copy:
-            var = config_copy[var_id]
-            id_ = var['input_id']
-            groups[id_] = var
-            
-            # Replace input_id key for sensor_id to be consistent with measurements
-            groups[id_]['sensor_id'] = groups[id_].pop('input_id')
-            # Replace subsystem key for group to be consistent with measurements
-            groups[id_]['group'] = groups[id_].pop('subsystem')
-            
-        # Not really needed, but for consistency
-        groupValues = [groups[var]["group"] for var in groups]
-        uniqueGroupValues = list(set(groupValues))
-        uniqueGroupValues.sort()
-        
-    elif type=='grouped_varIds': # Same as 'grouped' but with var_ids instead of sensor_ids as keys
+    elif type in ['grouped', 'grouped_varIds']:
         """
-            Returns a dict with both measurements and inputs using var ids as keys.
-            input_id and subsystem keys are substituted by sensor_id and group keys to be consistent with measurements
+            grouped: Used in data_export and data_visualization. Returns a dict with both measurements and inputs using sensor or input ids as keys.
+            grouped_varIds: Same as 'grouped' but with var_ids instead of sensor_ids as keys
             
+            input_id and subsystem keys are substituted by sensor_id and group keys to be consistent with measurements
         """
+        key = 'sensor_id' if type == 'grouped' else 'var_id'
         
-        groups = {}
-        for var_id in config['measurements']:
-            var = config['measurements'][var_id]
-            groups[var['var_id']] = var
-            
-        config_copy = copy.deepcopy(config['inputs']) # Copy since it's going to be modified
-        for var_id in config_copy:
-            var = config_copy[var_id]
-            id_ = var['var_id']
-            groups[id_] = var
-            
-            # Replace input_id key for sensor_id to be consistent with measurements
-            groups[id_]['sensor_id'] = groups[id_].pop('input_id')
-            # Replace subsystem key for group to be consistent with measurements
-            groups[id_]['group'] = groups[id_].pop('subsystem')
+        groups = {var[key]: var for var in config['measurements'].values()}
+        for var in config['inputs'].values():
+            var = as_measurement(var) # Copy since it's going to be modified
+            groups[var[key]] = var
             
         # Not really needed, but for consistency
-        groupValues = [groups[var]["group"] for var in groups]
-        uniqueGroupValues = list(set(groupValues))
-        uniqueGroupValues.sort()
+        uniqueGroupValues = sorted({var["group"] for var in groups.values()})
+        
+        variables = groups.values()
     
     else: raise ValueError('Type not recognized')
     
+    if table:
+        return groups, uniqueGroupValues, groups_table(variables, uniqueGroupValues)
+    
     return groups, uniqueGroupValues
 
 def fix_path(path):
@@ -394,22 +669,195 @@ def capfirst(s):
     """
     return s[:1].upper() + s[1:]
 
-def flatten_dict(d, parent_key='', separator='_'):
-    items = []
-    for k, v in d.items():
-        new_key = f"{parent_key}{separator}{k}" if parent_key else k
-        if isinstance(v, dict):
-            items.extend(flatten_dict(v, new_key, separator=separator).items())
+def iter_flat_items(d, parent_key='', separator='_'):
+    """Iterate over the (flattened key, value) pairs of a nested dict, depth first 
+        and without recursion or intermediate copies"""
+    stack = [(parent_key, iter(d.items()))]
+    while stack:
+        prefix, items = stack[-1]
+        for k, v in items:
+            new_key = f"{prefix}{separator}{k}" if prefix else k
+            if isinstance(v, dict):
+                stack.append((new_key, iter(v.items())))
+                break
+            yield new_key, v
         else:
-            items.append((new_key, v))
-    return dict(items)
+            stack.pop()
+
+def flatten_dict(d, parent_key='', separator='_'):
+    return dict(iter_flat_items(d, parent_key, separator))
+
+def unflatten_dict(d, separator='_'):
+    """Inverse of flatten_dict, keys are split at every separator so keys that 
+        contained the separator before flattening are nested further
+
+    Raises:
+        ValueError: If a key is both a value and the prefix of other keys, e.g. {'a': 1, 'a_b': 2}
+    """
+    nested = {}
+    created = {id(nested)} # Dicts created here, values that are dicts are not nested into
+    for key, value in d.items():
+        node = nested
+        parts = key.split(separator) if isinstance(key, str) else [key]
+        for part in parts[:-1]:
+            if part not in node:
+                node[part] = {}
+                created.add(id(node[part]))
+            elif id(node[part]) not in created:
+                raise ValueError(f'Key {key!r} collides with the value of {part!r} when unflattening')
+            node = node[part]
+            
+        if parts[-1] in node:
+            raise ValueError(f'Key {key!r} collides with other keys when unflattening')
+        node[parts[-1]] = value
+        
+    return nested
+
+class flat_dict_view(Mapping):
+    """Read-only flattened view of a nested dict, equivalent to flatten_dict(d) 
+        but nothing is copied: lookups walk the nested dict and iteration is lazy,
+        so the view reflects later changes in d.
+        
+        Keys may contain the separator, a lookup tries the possible splits of the 
+        flattened key at each level. Nested keys are looked up as strings, so 
+        non-string keys below the first level are only reachable by iterating.
+
+    Example:
+        view = flat_dict_view(server_structure)
+        node = view['Objects_Plant_TT-DES-001']
+    """
+    
+    def __init__(self, d:dict, separator='_'):
+        self.d = d
+        self.separator = separator
+        
+    def __getitem__(self, key):
+        value = self._lookup(self.d, key)
+        if value is self._missing:
+            raise KeyError(key)
+        
+        return value
+    
+    _missing = object()
+    
+    def _lookup(self, node:dict, key):
+        if key in node and not isinstance(node[key], dict):
+            return node[key]
+        if not isinstance(key, str):
+            return self._missing
+        
+        pos = key.find(self.separator)
+        while pos != -1:
+            child = node.get(key[:pos])
+            if isinstance(child, dict):
+                value = self._lookup(child, key[pos+len(self.separator):])
+                if value is not self._missing:
+                    return value
+            pos = key.find(self.separator, pos+1)
+            
+        return self._missing
+        
+    def __iter__(self):
+        return (key for key, _ in iter_flat_items(self.d, separator=self.separator))
+    
+    def __len__(self):
+        return sum(1 for _ in iter_flat_items(self.d, separator=self.separator))
+    
+    def items(self):
+        return _flat_items_view(self)
+    
+class _flat_items_view(ItemsView):
+    # Iterate without a lookup per key
+    def __iter__(self):
+        return iter_flat_items(self._mapping.d, separator=self._mapping.separator)
+
+
+class pattern_matcher():
+    """Precompiled matcher for a set of regular expressions, a string matches if 
+        any of the patterns matches at its beginning (same as re.match)
+
+        Patterns without special characters are plain prefixes and are checked 
+        with a single str.startswith, the rest are combined in one alternation 
+        so each string is scanned once. Compiled patterns (re.Pattern) are 
+        accepted and kept separate, so their flags are preserved.
+
+    Args:
+        patterns (list): Regular expressions, as strings or compiled
+    """
+    SPECIAL_CHARS = set('.^$*+?{}[]\\|()')
+    
+    def __init__(self, patterns):
+        self.patterns = tuple(patterns)
+        self.prefixes = tuple(p for p in self.patterns if isinstance(p, str) and not self.SPECIAL_CHARS.intersection(p))
+        regexes = [p for p in self.patterns if isinstance(p, str) and p not in self.prefixes]
+        
+        self.regexes = [p for p in self.patterns if isinstance(p, re.Pattern)]
+        if regexes:
+            try:
+                # Backreferences depend on group numbers, which change when combined
+                if any(re.search(r'\\[1-9]|\(\?P=', p) for p in regexes): raise re.error('backreference')
+                self.regexes.append(re.compile('|'.join(f'(?:{p})' for p in regexes)))
+            except re.error:
+                # e.g. inline global flags, keep them separate
+                self.regexes.extend(re.compile(p) for p in regexes)
+        
+    def match(self, string:str) -> bool:
+        if self.prefixes and string.startswith(self.prefixes):
+            return True
+        
+        return any(regex.match(string) for regex in self.regexes)
+    
+    def filter(self, strings) -> tuple:
+        """Strings that match any pattern
 
+        Returns:
+            tuple: (matches, indices) with the matching strings and their positions in strings
+        """
+        if not isinstance(strings, (list, tuple)):
+            strings = list(strings) # Iterators can only be consumed once
+        
+        match = self.match
+        indices = [idx for idx, string in enumerate(strings) if match(string)]
+        
+        return [strings[idx] for idx in indices], indices
+
+@functools.lru_cache(maxsize=128)
+def get_pattern_matcher(patterns:tuple) -> pattern_matcher:
+    """Memoized pattern_matcher for a set of patterns"""
+    return pattern_matcher(patterns)
 
-def filter_strings_with_pattern(strings, patterns):
-    filtered_strings = [s for s in strings if any(re.match(pattern, s) for pattern in patterns)]    
+def filter_strings_with_pattern(strings, patterns, return_indices=False):
+    """Filter the strings that match (re.match) any of the patterns
+
+    Args:
+        strings (list): Strings to filter
+        patterns (list): Regular expressions, as strings or compiled (re.Pattern)
+        return_indices (bool, optional): Also return the indices of the matches in strings. Defaults to False.
+
+    Returns:
+        list | tuple: Matching strings or (matching strings, indices)
+    """
+    filtered_strings, indices = get_pattern_matcher(tuple(patterns)).filter(strings)
+    
+    if return_indices:
+        return filtered_strings, indices
     
     return filtered_strings
 
+# Submodules are loaded on first access (librescada_utils.db_utils), importing 
+# the package alone does not import asyncua, pymongo or pandas
+SUBMODULES = ['opc_utils', 'db_utils', 'buffer_utils', 'metrics_utils']
+
+def __getattr__(name):
+    if name in SUBMODULES:
+        import importlib
+        return importlib.import_module(f'.{name}', __name__)
+    
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+def __dir__():
+    return sorted(list(globals()) + SUBMODULES)
+
 if __name__ == '__main__':
     # Api logger
     logger_api = logging.getLogger(__name__)
@@ -0,0 +1,119 @@
+import time
+import datetime
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ring_buffer():
+    """Fixed capacity, columnar ring buffer for the measurements of a group.
+
+        Values of all the variables in the group are stored in a single float64
+        array (one column per variable) and timestamps in an int64 array of
+        nanoseconds since epoch, so every read of the group is stored with one
+        vectorized write and no allocations.
+
+        Rows are written twice (at i and i+capacity) so that any window of the
+        latest rows is contiguous in memory and can be returned as a view
+        without copying, e.g. for plotting or exporting.
+
+        Example:
+            buffer = ring_buffer(['TT-DES-001', 'TT-DES-002'], maxLen=3600)
+            buffer.append([20.1, 35.2])
+            times, values = buffer.window(60)   # Last 60 reads
+            temp = buffer.variable('TT-DES-001')  # Column view of one variable
+    """
+
+    def __init__(self, var_ids:list, maxLen:int):
+        if maxLen <= 0:
+            raise ValueError(f'maxLen must be a positive integer, got {maxLen}')
+
+        self.var_ids = list(var_ids)
+        self.var_idx = {var_id: idx for idx, var_id in enumerate(self.var_ids)}
+        self.capacity = maxLen
+
+        self._values = np.full((2*maxLen, len(self.var_ids)), np.nan, dtype=np.float64)
+        self._time = np.zeros(2*maxLen, dtype=np.int64)
+        self.count = 0 # Total number of rows appended
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    @property
+    def nbytes(self) -> int:
+        return self._values.nbytes + self._time.nbytes
+
+    def append(self, values, time_ns:int=None):
+        """Append one row with the values of every variable (in var_ids order),
+            None values are stored as NaN
+
+        Args:
+            values (list | np.ndarray): Values of the variables
+            time_ns (int, optional): Timestamp in ns since epoch. Defaults to now.
+        """
+        if time_ns is None:
+            time_ns = time.time_ns()
+
+        row = self.count % self.capacity
+        # Writing a list with None to a float array raises, convert first
+        values = np.asarray(values, dtype=np.float64)
+
+        self._values[row] = values
+        self._values[row + self.capacity] = values
+        self._time[row] = time_ns
+        self._time[row + self.capacity] = time_ns
+
+        self.count += 1
+
+    def _window_slice(self, n:int=None) -> slice:
+        length = len(self)
+        n = length if n is None else min(n, length)
+        end = self.count % self.capacity + self.capacity
+
+        return slice(end - n, end)
+
+    def window(self, n:int=None):
+        """Return views of the last n rows (all the stored ones by default)
+
+        Returns:
+            tuple: (times, values) with times an int64 array of ns since epoch
+                   and values a (n, number of variables) float64 array
+        """
+        window = self._window_slice(n)
+
+        return self._time[window], self._values[window]
+
+    def times(self, n:int=None) -> np.ndarray:
+        """View of the last n timestamps as datetime64[ns]"""
+
+        return self._time[self._window_slice(n)].view('datetime64[ns]')
+
+    def variable(self, var_id:str, n:int=None) -> np.ndarray:
+        """View of the last n values of a variable"""
+
+        return self._values[self._window_slice(n), self.var_idx[var_id]]
+
+    def last(self) -> dict:
+        """Latest value of every variable"""
+        if not self.count:
+            return {var_id: None for var_id in self.var_ids}
+
+        row = (self.count - 1) % self.capacity
+
+        return dict(zip(self.var_ids, self._values[row].tolist()))
+
+    def last_time(self) -> datetime.datetime:
+        """Timestamp of the latest row or None if empty"""
+        if not self.count:
+            return None
+
+        time_ns = int(self._time[(self.count - 1) % self.capacity])
+
+        return datetime.datetime.fromtimestamp(time_ns / 1e9, tz=datetime.timezone.utc)
+
+    def clear(self):
+        self._values.fill(np.nan)
+        self._time.fill(0)
+        self.count = 0
@@ -1,20 +1,636 @@
 import pymongo
 from pymongo import MongoClient
-from pymongo.errors import ServerSelectionTimeoutError
+from pymongo.errors import ServerSelectionTimeoutError, BulkWriteError
+from pymongo import UpdateOne, ReplaceOne
+import atexit
 import logging
 import datetime
+import threading
+import time
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+import itertools
+import os
+from collections import OrderedDict
 import pandas as pd
 
-from librescada.web_interface.layout_utils import generate_alert
+from .metrics_utils import timed
+
+def generate_alert(*args, **kwargs):
+    # Imported when needed, loading the web interface is slow and most users of 
+    # this module (e.g. acquisition services) never generate alerts
+    from librescada.web_interface.layout_utils import generate_alert
+    
+    return generate_alert(*args, **kwargs)
+
+@functools.lru_cache(maxsize=None)
+def get_pymongoarrow():
+    """Optional accelerated decoder, BSON batches are decoded directly into Arrow 
+        columns. Imported on first use since it loads pyarrow
+
+    Returns:
+        module: pymongoarrow.api or None if not installed
+    """
+    try:
+        import pymongoarrow.api
+    except ImportError:
+        return None
+    
+    return pymongoarrow.api
+
+# Number of documents per batch retrieved from the server when fetching data
+QUERY_BATCH_SIZE = 10000
+
+# Default thresholds of the buffered writer (insert_samples), a flush is triggered 
+# when either the number of buffered samples or the time since the last flush is reached
+WRITE_BATCH_SIZE = 1000
+WRITE_FLUSH_INTERVAL = 1.0 # seconds
+WRITE_MAX_BUFFERED = 100000 # Oldest samples are dropped above this, e.g. if the database is down
+WRITE_CLOSE_TIMEOUT = 10.0 # seconds close_writer waits for the writer, so a stalled connection does not hang exit
+
+# Seconds a chunk of the data cache keeps being updated after its end, and how far back 
+# the updates look, for samples that arrive late (several loggers, writer retries...)
+DATA_CACHE_GRACE = 30.0
+
+# Aggregations supported when downsampling data in the database
+AGGREGATIONS = {'mean': '$avg', 'min': '$min', 'max': '$max', 'first': '$first', 'last': '$last', 'minmax': None}
+
+# Shared clients (see get_mongo_client), a MongoClient is thread safe and keeps 
+# its own connection pool so one per connection string is enough for a process
+MONGO_CLIENT_OPTIONS = {'serverSelectionTimeoutMS': 1000, 'tz_aware': True, 
+                        'maxPoolSize': 20, 'minPoolSize': 1, 'maxIdleTimeMS': 60000}
+# Seconds the result of the liveness / last timestamp probe is reused, see database.probe
+PROBE_TTL = 5.0
+
+# Threads used by async_database to run blocking queries
+DB_EXECUTOR_WORKERS = 4
+
+_mongo_clients = {}
+_mongo_clients_lock = threading.Lock()
+
+# Per day summary of a time series collection, stored in <collection>_daily_summary, 
+# documents are keyed by the day (UTC midnight) plus one info document
+SUMMARY_SUFFIX = '_daily_summary'
+SUMMARY_INFO_ID = 'summary_info'
+# Days are considered complete (and summarized) once this long has passed since they ended
+SUMMARY_GRACE = datetime.timedelta(hours=1)
+# Variable names are keys of the stats of a summary document, '.' and a leading '$' 
+# are not valid in update paths and are stored as their fullwidth counterparts
+SUMMARY_FIELD_ESCAPES = {'.': '\uff0e', '$': '\uff04'}
+
+
+def find_dataframe(collection, query:dict, fields:list, batch_size=QUERY_BATCH_SIZE) -> pd.DataFrame:
+    """Query a time series collection and return a DataFrame indexed by time with
+        one column per field, sorted by time. Only the time and the given fields 
+        are retrieved from the database.
+        
+        If pymongoarrow is available the documents are decoded directly into typed 
+        columns, otherwise the cursor is consumed column by column, which avoids 
+        building the DataFrame from a list of documents (very slow)
+
+    Args:
+        collection (pymongo.collection.Collection): Collection to query
+        query (dict): Query filter
+        fields (list): Fields (variables) to retrieve, time is always included
+        batch_size (int, optional): Cursor batch size. Defaults to QUERY_BATCH_SIZE.
+
+    Returns:
+        pd.DataFrame: Data with a UTC DatetimeIndex named time
+    """
+    projection = {'_id':0, 'time':1}
+    projection.update({field:1 for field in fields})
+    
+    pymongoarrow_api = get_pymongoarrow()
+    if pymongoarrow_api is not None:
+        data = pymongoarrow_api.find_pandas_all(collection, query, projection=projection, sort=[('time', pymongo.ASCENDING)], 
+                               batch_size=batch_size)
+        data = data.reindex(columns=['time'] + list(fields))
+    else:
+        cursor = collection.find(query, projection, batch_size=batch_size).sort('time', pymongo.ASCENDING)
+        data = cursor_to_dataframe(cursor, ['time'] + list(fields))
+            
+    data['time'] = pd.to_datetime(data['time'], utc=True)
+    data.set_index('time', inplace=True)
+    
+    return data
+
+def cursor_to_dataframe(cursor, fields:list) -> pd.DataFrame:
+    """Consume a cursor column by column into a DataFrame with the given fields"""
+    columns = {field: [] for field in fields}
+    appends = [(field, columns[field].append) for field in columns]
+    for document in cursor:
+        for field, append in appends:
+            append(document.get(field))
+            
+    return pd.DataFrame(columns)
+
+def iter_dataframes(collection, query:dict, fields:list, chunk=QUERY_BATCH_SIZE, batch_size=None):
+    """Generator version of find_dataframe, the documents are consumed from a 
+        server side cursor and yielded in DataFrames of at most chunk rows, so 
+        memory usage does not depend on the length of the queried period
+
+    Args:
+        collection (pymongo.collection.Collection): Collection to query
+        query (dict): Query filter
+        fields (list): Fields (variables) to retrieve, time is always included
+        chunk (int, optional): Maximum number of rows per DataFrame. Defaults to QUERY_BATCH_SIZE.
+        batch_size (int, optional): Cursor batch size. Defaults to chunk.
+
+    Yields:
+        pd.DataFrame: Data with a UTC DatetimeIndex named time
+    """
+    projection = {'_id':0, 'time':1}
+    projection.update({field:1 for field in fields})
+    
+    cursor = collection.find(query, projection, batch_size=batch_size or chunk).sort('time', pymongo.ASCENDING)
+    try:
+        while True:
+            data = cursor_to_dataframe(itertools.islice(cursor, chunk), ['time'] + list(fields))
+            if data.empty:
+                break
+            
+            data['time'] = pd.to_datetime(data['time'], utc=True)
+            data.set_index('time', inplace=True)
+            
+            yield data
+    finally:
+        cursor.close()
+
+def write_dataframes(frames, path:str, format:str=None) -> int:
+    """Write an iterable of DataFrames (e.g. from iter_dataframes) to a file 
+        one at a time, so only one chunk is kept in memory
+
+    Args:
+        frames (iterable): DataFrames with the same columns
+        path (str): Output file
+        format (str, optional): csv, parquet or ndjson. Defaults to the file extension.
+
+    Raises:
+        ValueError: If the format is not supported
+
+    Returns:
+        int: Number of rows written
+    """
+    if format is None:
+        format = os.path.splitext(path)[1].lstrip('.').lower()
+    if format == 'jsonl':
+        format = 'ndjson'
+    if format not in ['csv', 'parquet', 'ndjson']:
+        raise ValueError(f'Format {format} not supported, options are: csv, parquet, ndjson')
+    
+    rows = 0
+    if format == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        
+        writer = None
+        try:
+            for data in frames:
+                if writer is None:
+                    table = pa.Table.from_pandas(data, preserve_index=True)
+                    # Columns without any value in the first chunk would have null type
+                    schema = pa.schema([pa.field(field.name, pa.float64()) if pa.types.is_null(field.type) else field 
+                                        for field in table.schema], metadata=table.schema.metadata)
+                    writer = pq.ParquetWriter(path, schema)
+                writer.write_table(pa.Table.from_pandas(data, schema=writer.schema, preserve_index=True))
+                rows += len(data)
+        finally:
+            if writer is not None:
+                writer.close()
+        
+    else:
+        with open(path, 'w') as f:
+            for idx, data in enumerate(frames):
+                if format == 'csv':
+                    data.to_csv(f, header=idx==0)
+                else:
+                    data.reset_index().to_json(f, orient='records', lines=True, date_format='iso')
+                rows += len(data)
+                
+    return rows
+
+def aggregate_dataframe(collection, query:dict, fields:list, resolution, aggregation='mean', 
+                        fill=None, batch_size=QUERY_BATCH_SIZE) -> pd.DataFrame:
+    """Downsample the data in the database, so only one row per time bucket 
+        crosses the wire. Documents matching query are grouped in buckets of 
+        resolution length and each field aggregated within its bucket.
+
+    Args:
+        collection (pymongo.collection.Collection): Collection to query
+        query (dict): Query filter
+        fields (list): Fields (variables) to retrieve
+        resolution (str | float | datetime.timedelta): Bucket length, either a pandas 
+            timedelta string ('10s', '5min', '1h'), a number of seconds or a timedelta
+        aggregation (str, optional): mean, min, max, first, last or minmax. minmax 
+            preserves the extrema for trend displays, returning two rows per bucket: 
+            the minimum at the start of the bucket and the maximum at its middle. Defaults to 'mean'.
+        fill (str, optional): Fill empty buckets: None (leave them out), 'locf' 
+            (last observation carried forward) or 'linear'. Defaults to None.
+        batch_size (int, optional): Cursor batch size. Defaults to QUERY_BATCH_SIZE.
+
+    Raises:
+        ValueError: If the resolution is below one second or not a whole number of 
+                    milliseconds, or the aggregation is not supported
+
+    Returns:
+        pd.DataFrame: Data with a UTC DatetimeIndex named time
+    """
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f'Aggregation {aggregation} not supported, options are: {list(AGGREGATIONS.keys())}')
+    
+    resolution = pd.Timedelta(resolution if not isinstance(resolution, (int, float)) else f'{resolution}s')
+    if resolution < pd.Timedelta(seconds=1):
+        raise ValueError(f'Resolution must be at least one second, got {resolution}')
+    # Fractional resolutions (e.g. '1.5s') are bucketed in milliseconds
+    if resolution % pd.Timedelta(seconds=1):
+        if resolution % pd.Timedelta(milliseconds=1):
+            raise ValueError(f'Resolution must be a whole number of milliseconds, got {resolution}')
+        unit, bin_size = 'millisecond', resolution // pd.Timedelta(milliseconds=1)
+    else:
+        unit, bin_size = 'second', resolution // pd.Timedelta(seconds=1)
+    
+    if aggregation == 'minmax':
+        output_fields = [f'{field}{suffix}' for field in fields for suffix in ['__min', '__max']]
+        group = {f'{field}__min': {'$min': f'${field}'} for field in fields}
+        group.update({f'{field}__max': {'$max': f'${field}'} for field in fields})
+    else:
+        output_fields = list(fields)
+        group = {field: {AGGREGATIONS[aggregation]: f'${field}'} for field in fields}
+        
+    group['_id'] = {'$dateTrunc': {'date': '$time', 'unit': unit, 'binSize': bin_size}}
+    
+    pipeline = [
+        {'$match': query},
+        {'$sort': {'time': 1}}, # So first and last are meaningful
+        {'$group': group},
+        {'$set': {'time': '$_id'}},
+        {'$unset': '_id'},
+        {'$sort': {'time': 1}},
+    ]
+    
+    if fill:
+        if fill not in ['locf', 'linear']:
+            raise ValueError(f'Fill method {fill} not supported, options are: locf, linear')
+        
+        pipeline.append({'$densify': {'field': 'time', 'range': {'step': bin_size, 'unit': unit, 'bounds': 'full'}}})
+        pipeline.append({'$fill': {'sortBy': {'time': 1}, 'output': {field: {'method': fill} for field in output_fields}}})
+    
+    pymongoarrow_api = get_pymongoarrow()
+    if pymongoarrow_api is not None:
+        data = pymongoarrow_api.aggregate_pandas_all(collection, pipeline, batchSize=batch_size)
+        data = data.reindex(columns=['time'] + output_fields)
+    else:
+        cursor = collection.aggregate(pipeline, batchSize=batch_size)
+        data = cursor_to_dataframe(cursor, ['time'] + output_fields)
+        
+    data['time'] = pd.to_datetime(data['time'], utc=True)
+    data.set_index('time', inplace=True)
+    
+    if aggregation == 'minmax':
+        data_min = data[[f'{field}__min' for field in fields]].set_axis(fields, axis=1)
+        data_max = data[[f'{field}__max' for field in fields]].set_axis(fields, axis=1)
+        data_max.index = data_max.index + resolution / 2
+        data = pd.concat([data_min, data_max]).sort_index(kind='stable')
+    
+    return data
+
+def summarize_samples(data) -> dict:
+    """Compute the partial daily summary of a set of samples: first and last 
+        timestamp, number of samples, variables and per-variable min/max/sum/count
+
+    Args:
+        data (list | pd.DataFrame): Samples (dictionaries with a time key) or 
+                                    DataFrame with a time column
+
+    Returns:
+        dict: Summary per day, keyed by the day as a naive UTC midnight datetime
+    """
+    data = pd.DataFrame(data)
+    if data.empty or 'time' not in data:
+        return {}
+    
+    data = data.drop(columns='_id', errors='ignore')
+    data['time'] = pd.to_datetime(data['time'], utc=True)
+    days = data['time'].dt.floor('D').dt.tz_localize(None)
+    
+    summary = {}
+    for day, day_data in data.groupby(days, sort=True):
+        stats = {}
+        variables = []
+        for var in day_data.columns.drop('time'):
+            values = day_data[var]
+            if values.isna().all():
+                continue
+            variables.append(var)
+            
+            values = pd.to_numeric(values, errors='coerce').dropna()
+            if not values.empty:
+                stats[var] = {'min': float(values.min()), 'max': float(values.max()), 
+                              'sum': float(values.sum()), 'count': int(values.count())}
+                
+        summary[day.to_pydatetime()] = {
+            'first_time': day_data['time'].min().to_pydatetime(), 
+            'last_time':  day_data['time'].max().to_pydatetime(), 
+            'count': len(day_data), 'variables': variables, 'stats': stats
+        }
+        
+    return summary
+
+def escape_summary_field(var:str) -> str:
+    """Variable name as stored in the stats of the summary collection"""
+    var = var.replace('.', SUMMARY_FIELD_ESCAPES['.'])
+    if var.startswith('$'):
+        var = SUMMARY_FIELD_ESCAPES['$'] + var[1:]
+    return var
+
+def unescape_summary_field(field:str) -> str:
+    """Inverse of escape_summary_field"""
+    field = field.replace(SUMMARY_FIELD_ESCAPES['.'], '.')
+    if field.startswith(SUMMARY_FIELD_ESCAPES['$']):
+        field = '$' + field[1:]
+    return field
+
+def merge_summaries(summary:dict, other:dict) -> dict:
+    """Merge the partial daily summary other into summary (modified in place)"""
+    
+    for day, day_summary in other.items():
+        if day not in summary:
+            summary[day] = day_summary
+            continue
+        
+        current = summary[day]
+        current['first_time'] = min(current['first_time'], day_summary['first_time'])
+        current['last_time'] = max(current['last_time'], day_summary['last_time'])
+        current['count'] += day_summary['count']
+        current['variables'] += [var for var in day_summary['variables'] if var not in current['variables']]
+        
+        for var, stats in day_summary['stats'].items():
+            if var not in current['stats']:
+                current['stats'][var] = stats
+            else:
+                current_stats = current['stats'][var]
+                current_stats['min'] = min(current_stats['min'], stats['min'])
+                current_stats['max'] = max(current_stats['max'], stats['max'])
+                current_stats['sum'] += stats['sum']
+                current_stats['count'] += stats['count']
+                
+    return summary
+
+def get_mongo_client(connection_string:str, **kwargs) -> MongoClient:
+    """Get the MongoClient of a connection string, it is created the first time 
+        and then shared by all the database objects of the process
+
+    Args:
+        connection_string (str): MongoDB connection string
+        **kwargs: Options that override MONGO_CLIENT_OPTIONS, only used when the client is created
+
+    Returns:
+        MongoClient: Shared client
+    """
+    with _mongo_clients_lock:
+        client = _mongo_clients.get(connection_string)
+        if client is None:
+            client = MongoClient(connection_string, **{**MONGO_CLIENT_OPTIONS, **kwargs})
+            _mongo_clients[connection_string] = client
+            
+    return client
+
+def close_mongo_clients():
+    """Close all the shared clients, e.g. when the process is shutting down"""
+    with _mongo_clients_lock:
+        for client in _mongo_clients.values():
+            client.close()
+        _mongo_clients.clear()
+
+def to_utc_timestamp(value) -> pd.Timestamp:
+    """Convert a datetime (naive datetimes are assumed to be in UTC) to a UTC pd.Timestamp"""
+    value = pd.Timestamp(value)
+    
+    return value.tz_localize('UTC') if value.tzinfo is None else value.tz_convert('UTC')
+
+class data_chunk_cache():
+    """Cache for get_data partitioned in time chunks (one hour by default) per variable.
+    
+        Requests for overlapping or shifted ranges only query the database for the 
+        chunks that are not cached yet. Chunks that may still receive data (until 
+        grace seconds after their end) are live and updated incrementally: their tail 
+        is queried again from overlap seconds before the last fetched timestamp and 
+        replaced, so samples that land late with earlier timestamps are picked up.
+        
+        Samples written with database.write_samples (or insert_samples) make the 
+        chunks they fall in live again (see touch), including closed ones. Data 
+        written by other processes more than grace seconds late is not detected, 
+        use invalidate in that case.
+        
+        Chunks are evicted in least recently used order when the cache grows over 
+        max_bytes.
+    """
+    
+    def __init__(self, max_bytes=256*1024**2, chunk_size='1h', grace=DATA_CACHE_GRACE, overlap=None):
+        self.max_bytes = max_bytes
+        self.chunk_size = pd.Timedelta(chunk_size)
+        self.grace = pd.Timedelta(grace, 's')
+        self.overlap = pd.Timedelta(overlap if overlap is not None else grace, 's')
+        
+        self.chunks = OrderedDict() # (var, chunk_start) -> pd.Series
+        self.live = {}              # (var, chunk_start) -> last fetched timestamp, for chunks that may still receive data
+        self.nbytes = 0
+        self.lock = threading.Lock()
+        
+    def get(self, collection, initial_datetime, final_datetime, vars:list) -> pd.DataFrame:
+        """Return the data of vars between initial_datetime and final_datetime 
+            (both excluded), querying the database only for missing chunks"""
+        start = to_utc_timestamp(initial_datetime)
+        end = to_utc_timestamp(final_datetime)
+        now = pd.Timestamp.now(tz='UTC')
+        chunk_starts = list(pd.date_range(start.floor(self.chunk_size), end, freq=self.chunk_size))
+        
+        parts = {var: {} for var in vars}
+        missing = {} # chunk_start -> vars
+        updates = {} # chunk_start -> vars
+        with self.lock:
+            for chunk_start in chunk_starts:
+                for var in vars:
+                    key = (var, chunk_start)
+                    if key not in self.chunks:
+                        missing.setdefault(chunk_start, set()).add(var)
+                        continue
+                    
+                    self.chunks.move_to_end(key)
+                    parts[var][chunk_start] = self.chunks[key]
+                    if key in self.live:
+                        updates.setdefault(chunk_start, set()).add(var)
+            
+        # Fetch contiguous runs of missing chunks with a single query each
+        for run in self._contiguous_runs(sorted(missing)):
+            run_vars = sorted(set().union(*[missing[chunk_start] for chunk_start in run]))
+            data = find_dataframe(collection, {'time':{'$gte':run[0].to_pydatetime(), 
+                                                       '$lt':(run[-1] + self.chunk_size).to_pydatetime()}}, run_vars)
+            
+            for chunk_start in run:
+                chunk_data = self._slice(data, chunk_start, chunk_start + self.chunk_size)
+                live = self._is_live(chunk_start, now)
+                for var in missing[chunk_start]:
+                    series = chunk_data[var].copy()
+                    parts[var][chunk_start] = self._store((var, chunk_start), series, self._fetched_until(series, chunk_start) if live else None)
+                
+        # Update live chunks, querying again their tail (from overlap before the last 
+        # fetched timestamp) to also get samples that arrived late
+        for chunk_start, update_vars in updates.items():
+            with self.lock:
+                cutoffs = {var: self.live.get((var, chunk_start), chunk_start) - self.overlap for var in update_vars}
+            data = find_dataframe(collection, {'time':{'$gte':max(min(cutoffs.values()), chunk_start).floor('us').to_pydatetime(), 
+                                                       '$lt':(chunk_start + self.chunk_size).to_pydatetime()}}, sorted(update_vars))
+            
+            live = self._is_live(chunk_start, now)
+            for var in update_vars:
+                key = (var, chunk_start)
+                series = parts[var][chunk_start]
+                # The queried tail replaces the cached one, so there are no duplicated timestamps
+                tail = data[var][data.index > cutoffs[var]]
+                series = pd.concat([series[series.index <= cutoffs[var]], tail])
+                series = series[~series.index.duplicated(keep='last')]
+                    
+                parts[var][chunk_start] = self._store(key, series, self._fetched_until(series, chunk_start) if live else None)
+        
+        with self.lock:
+            self._evict()
+            
+        if not vars:
+            return pd.DataFrame(index=pd.DatetimeIndex([], tz='UTC', name='time'))
+        
+        data = pd.concat({var: pd.concat([parts[var][chunk_start] for chunk_start in chunk_starts]) for var in vars}, axis=1)
+        data.index.name = 'time'
+        
+        return data[(data.index > start) & (data.index < end)]
+    
+    def invalidate(self, initial_datetime=None, final_datetime=None):
+        """Remove the chunks overlapping a period, all of them if not specified"""
+        start = to_utc_timestamp(initial_datetime) if initial_datetime is not None else None
+        end = to_utc_timestamp(final_datetime) if final_datetime is not None else None
+        
+        with self.lock:
+            for key in list(self.chunks):
+                chunk_start = key[1]
+                if (start is None or chunk_start + self.chunk_size > start) and (end is None or chunk_start < end):
+                    self._remove(key)
+    
+    def clear(self):
+        self.invalidate()
+        
+    def touch(self, samples:list):
+        """Make the cached chunks where samples (dictionaries with time and one key 
+            per variable) fall live, so their data is queried again on the next get"""
+        if not samples or not self.chunks:
+            return
+        
+        times = [to_utc_timestamp(sample['time']) for sample in samples if 'time' in sample]
+        if not times:
+            return
+        first, last = min(times), max(times)
+        vars = set().union(*samples) - {'time', '_id'}
+        
+        with self.lock:
+            for chunk_start in pd.date_range(first.floor(self.chunk_size), last, freq=self.chunk_size):
+                for var in vars:
+                    key = (var, chunk_start)
+                    if key in self.chunks:
+                        self.live[key] = min(self.live.get(key, first), first - pd.Timedelta(1, 'ns'))
+    
+    def _is_live(self, chunk_start, now) -> bool:
+        return chunk_start + self.chunk_size + self.grace > now
+    
+    @staticmethod
+    def _fetched_until(series:pd.Series, chunk_start):
+        return series.index[-1] if len(series) else chunk_start - pd.Timedelta(1, 'ns')
+    
+    def _contiguous_runs(self, chunk_starts:list) -> list:
+        runs = []
+        for chunk_start in chunk_starts:
+            if runs and runs[-1][-1] + self.chunk_size == chunk_start:
+                runs[-1].append(chunk_start)
+            else:
+                runs.append([chunk_start])
+                
+        return runs
+    
+    @staticmethod
+    def _slice(data:pd.DataFrame, start, end) -> pd.DataFrame:
+        """Rows of data (sorted by time) in [start, end)"""
+        return data.iloc[data.index.searchsorted(start, side='left'):data.index.searchsorted(end, side='left')]
+    
+    def _store(self, key, series:pd.Series, fetched_until=None) -> pd.Series:
+        with self.lock:
+            if key in self.chunks:
+                self._remove(key)
+                
+            self.chunks[key] = series
+            self.nbytes += series.memory_usage(index=True, deep=False)
+            if fetched_until is not None:
+                self.live[key] = fetched_until
+                
+        return series
+    
+    def _remove(self, key):
+        series = self.chunks.pop(key)
+        self.nbytes -= series.memory_usage(index=True, deep=False)
+        self.live.pop(key, None)
+    
+    def _evict(self):
+        while self.nbytes > self.max_bytes and self.chunks:
+            self._remove(next(iter(self.chunks)))
+    
 
 class database():
+    """Time series collection of samples (time key plus one key per variable).
+    
+        Queries about whole days (get_test_days, check_for_data, check_available_variables, 
+        get_day_summary...) use a daily summary stored in <collection>_daily_summary for 
+        the days it covers and the collection for the rest. The summary is kept up to 
+        date with every write and completed days are summarized in the background. 
+        If it has never been built, the first query that needs it starts building it 
+        in the background (scanning the whole collection once) unless build_summary 
+        is False, in which case run rebuild_summary when deploying.
+    """
         
-    def __init__(self, connection_string, database_name, collection_name, create_if_not_exist=False):
+    def __init__(self, connection_string, database_name, collection_name, create_if_not_exist=False,
+                 data_cache_mb=256, data_cache_chunk='1h', data_cache_grace=DATA_CACHE_GRACE, build_summary=True):
         self.isConnected = False
         self.dBconnectionString = connection_string
         self.db_name = database_name
         self.collection_name = collection_name
         
+        # Cache used by get_data, partitioned in time chunks per variable
+        # (live chunks are updated for data_cache_grace seconds after their end, it should 
+        # be longer than write_flush_interval plus the retries of the writer)
+        self.data_cache = data_chunk_cache(max_bytes=data_cache_mb*1024**2, chunk_size=data_cache_chunk, 
+                                           grace=data_cache_grace)
+        
+        # Buffered writer, see insert_samples
+        self.write_batch_size = WRITE_BATCH_SIZE
+        self.write_flush_interval = WRITE_FLUSH_INTERVAL
+        self.write_max_buffered = WRITE_MAX_BUFFERED
+        self.write_stats = {'inserted': 0, 'duplicates': 0, 'errors': 0, 'dropped': 0}
+        self._write_buffer = []
+        self._write_lock = threading.Lock()
+        self._write_event = threading.Event()
+        self._writer_thread = None
+        self._writer_stop = False
+        self._writer_atexit = False
+        
+        # Cached result of probe
+        self.probe_ttl = PROBE_TTL
+        self._probe = None
+        
+        # Daily summary collection, see rebuild_summary
+        self.summary_col = None
+        self._summary_info = None   # (info document, time.monotonic() when read)
+        self._summary_thread = None # Background build / catch up
+        self._summary_lock = threading.Lock()
+        self._summary_warned = False
+        self.build_summary = build_summary
+        
         self.logger = logging.getLogger(__name__)
         
         self.connect(create_if_not_exist)
@@ -24,8 +640,8 @@ class database():
     
     def connect(self, create_if_not_exist=False):
         try: 
-                self.db_client = MongoClient(self.dBconnectionString, serverSelectionTimeoutMS=1000, tz_aware=True)
-                self.db_client.server_info()
+                self.db_client = get_mongo_client(self.dBconnectionString)
+                self.db_client.admin.command('ping')
                 self.isConnected = True
                  
         except Exception as e:
@@ -42,7 +658,8 @@ class database():
                 if not create_if_not_exist:
                     err_message = f'Database {self.db_name} does not exist, available options are: {self.db_client.list_database_names()}'
                     self.logger.error(err_message)
-                    self.db_client.close()
+                    # The client is shared with other database objects, it is not closed
+                    self.isConnected = False
                     # Generate error message in the alert and change color, include exception
                     return generate_alert(err_message, 'danger')
                 else:
@@ -75,166 +692,696 @@ class database():
                 
             else:
                 self.col = self.db.get_collection(self.collection_name)
+                
+            if self.collection_name != 'operation_points':
+                self.summary_col = self.db.get_collection(self.collection_name + SUMMARY_SUFFIX)
+            
+    def probe(self, ttl:float=None) -> dict:
+        """Check that the server is alive and get the newest timestamp of the 
+            collection. The result is reused for ttl seconds so frequent health 
+            checks (e.g. every dashboard refresh) do not reach the server each time
+
+        Args:
+            ttl (float, optional): Seconds a previous result is valid. Defaults to self.probe_ttl.
+
+        Returns:
+            dict: alive (bool), newest (datetime or None) and checked_at (time.monotonic() of the check)
+        """
+        ttl = self.probe_ttl if ttl is None else ttl
+        now = time.monotonic()
+        
+        if self._probe is not None and now - self._probe['checked_at'] < ttl:
+            return self._probe
+        
+        try:
+            self.db_client.admin.command('ping')
+            newest = self.get_newest_datetime()
+            self._probe = {'alive': True, 'newest': newest[0] if newest else None, 'checked_at': now}
+        except Exception as e:
+            self.logger.error(f'Database probe failed: {e}')
+            self._probe = {'alive': False, 'newest': None, 'checked_at': now}
+            
+        return self._probe
             
     def check_connection(self, return_type='alert'):
         if self.isConnected == False:
             return self.connect()
         
-        else:
-            try:
-                self.db_client.server_info()
-                self.isConnected = True
-                # Generate info alert with last time the db received a new entry
+        probe = self.probe()
+        if not probe['alive']:
+            self.isConnected = False
+            self._probe = None
+            return self.connect()
+        
+        # Generate info alert with last time the db received a new entry
+        lastDate = probe['newest']
+        if lastDate:
+            timeDif = datetime.datetime.now(tz=datetime.timezone.utc) - lastDate
+            timeDif_secs = timeDif.total_seconds()
+            
+            if timeDif_secs/86400 > 1:
+                message = f"INFO: Last database update took place {timeDif_secs/86400:.2f} days ago"
+            elif timeDif_secs/3600 > 1:
+                message = f"INFO: Last database update took place {timeDif_secs/3600:.2f} hours ago"
+            elif timeDif_secs/60 > 1:
+                message = f"INFO: Last database update took place {timeDif_secs/60:.2f} minutes ago"
+            else:
+                message = f"INFO: Last database update took place {timeDif_secs:.2f} seconds ago"
                 
-                lastDate = self.get_newest_datetime()[0]
-                if lastDate:
-                    timeDif = datetime.datetime.now(tz=datetime.timezone.utc) - lastDate
-                    timeDif_secs = timeDif.total_seconds()
-                    
-                    if timeDif_secs/86400 > 1:
-                        message = f"INFO: Last database update took place {timeDif_secs/86400:.2f} days ago"
-                    elif timeDif_secs/3600 > 1:
-                        message = f"INFO: Last database update took place {timeDif_secs/3600:.2f} hours ago"
-                    elif timeDif_secs/60 > 1:
-                        message = f"INFO: Last database update took place {timeDif_secs/60:.2f} minutes ago"
-                    else:
-                        message = f"INFO: Last database update took place {timeDif_secs:.2f} seconds ago"
-                        
-                    if return_type == 'alert':
-                        return generate_alert(message, 'info')
-                    else: return message
-                else:
-                    if return_type == 'alert':
-                        return generate_alert('No data in database', 'warning')
-                    else: return 'No data in database'
-                    
-            except Exception:
-                return self.connect()
+            if return_type == 'alert':
+                return generate_alert(message, 'info')
+            else: return message
+        else:
+            if return_type == 'alert':
+                return generate_alert('No data in database', 'warning')
+            else: return 'No data in database'
     
     def get_oldest_datetime(self):
         data = self.col.find({}, {'time':1, '_id':0}).sort('time', pymongo.ASCENDING).limit(1)
         # data = data[0]['time'].replace(tzinfo=pytz.UTC)
         return [d['time'] for d in data]
     
+    @timed('db_get_newest_datetime')
     def get_newest_datetime(self):
         data = self.col.find({}, {'time':1, '_id':0}).sort('time', pymongo.DESCENDING).limit(1)
         # data = data[0]['time'].replace(tzinfo=pytz.UTC)
         return [d['time'] for d in data]
     
+    @timed('db_check_for_data')
     def check_for_data(self, initial_date, final_date):
-        initial_datetime = datetime.datetime.combine(initial_date, datetime.time(0,0,0))
-        final_datetime = datetime.datetime.combine(final_date,   datetime.time(23,59,59))
+        initial_day = datetime.datetime.combine(initial_date, datetime.time(0,0,0))
+        final_day = datetime.datetime.combine(final_date, datetime.time(0,0,0))
         
-        data = self.col.find({'time':{'$lt':final_datetime, '$gt':initial_datetime}},{'time':1, '_id':0}).limit(1)
-        
-        if [d['time'] for d in data]:
-            return True
-        else: 
+        complete_until = self._summary_coverage()
+        if complete_until is not None and initial_day < complete_until:
+            day_query = {'$gte':initial_day, '$lte':min(final_day, complete_until - datetime.timedelta(days=1))}
+            if self.summary_col.find_one({'_id':day_query, 'count':{'$gt':0}}, {'_id':1}) is not None:
+                return True
+            initial_day = complete_until
+            
+        if initial_day > final_day:
             return False
         
+        # Days not covered by the summary
+        data = self.col.find_one({'time':{'$gte':initial_day, '$lt':final_day + datetime.timedelta(days=1)}}, {'_id':1})
+        
+        return data is not None
+        
+    @timed('db_check_available_variables')
     def check_available_variables(self, date):
-        check_datetime = datetime.datetime.combine(date, datetime.time(0,0,0))
-        data = self.col.find({'time':{'$gte':check_datetime}},{'time':0, '_id':0}).sort('time', pymongo.ASCENDING).limit(1)
+        """Variables available in the first day with data starting from date"""
+        check_day = datetime.datetime.combine(date, datetime.time(0,0,0))
         
-        return [list(d.keys()) for d in data][0]        
+        complete_until = self._summary_coverage()
+        if complete_until is not None and check_day < complete_until:
+            data = self.summary_col.find({'_id':{'$gte':check_day, '$lt':complete_until}, 'count':{'$gt':0}}, 
+                                         {'variables':1}).sort('_id', pymongo.ASCENDING).limit(1)
+            variables = [d['variables'] for d in data]
+            if variables:
+                return variables[0]
+            check_day = complete_until
+            
+        # Days not covered by the summary, variables of the first sample
+        data = self.col.find({'time':{'$gte':check_day}}, {'time':0, '_id':0}).sort('time', pymongo.ASCENDING).limit(1)
         
-    def get_newest_datetime_in_date(self, date):
-        check_datetime_min = datetime.datetime.combine(date, datetime.time(0,0,0))
-        check_datetime_max = datetime.datetime.combine(date, datetime.time(23,59,59))
-
-        data = self.col.find({'time':{'$gte':check_datetime_min},
-                              'time':{'$lte':check_datetime_max}},{'time':1, '_id':0}).sort('time', pymongo.DESCENDING).limit(1)
+        return [list(d.keys()) for d in data][0]
         
-        result = [d['time'] for d in data][0]
-        print(result)
-        return result
+    def get_newest_datetime_in_date(self, date):
+        return self._datetime_in_date(date, 'last_time', pymongo.DESCENDING)
     
     def get_oldest_datetime_in_date(self, date):
-        check_datetime_min = datetime.datetime.combine(date, datetime.time(0,0,0))
-        check_datetime_max = datetime.datetime.combine(date, datetime.time(23,59,59))
-        data = self.col.find({'time':{'$gte':check_datetime_min},
-                              'time':{'$lte':check_datetime_max}},{'time':1, '_id':0}).sort('time', pymongo.ASCENDING).limit(1)
+        return self._datetime_in_date(date, 'first_time', pymongo.ASCENDING)
+    
+    def _datetime_in_date(self, date, field, direction):
+        check_day = datetime.datetime.combine(date, datetime.time(0,0,0))
+        
+        complete_until = self._summary_coverage()
+        if complete_until is not None and check_day < complete_until:
+            return self.get_day_summary(date)[field]
+        
+        data = self.col.find({'time':{'$gte':check_day, '$lt':check_day + datetime.timedelta(days=1)}}, 
+                             {'time':1, '_id':0}).sort('time', direction).limit(1)
+        
+        return [d['time'] for d in data][0]
+    
+    def get_day_summary(self, date) -> dict:
+        """Summary of a day: first_time, last_time, count, variables and 
+            stats (min, max, mean and count per variable)
+
+        Raises:
+            IndexError: If there is no data in date
+        """
+        check_day = datetime.datetime.combine(date, datetime.time(0,0,0))
         
-        result = [d['time'] for d in data][0]
-        print(result)
-        return result
+        complete_until = self._summary_coverage()
+        if complete_until is not None and check_day < complete_until:
+            data = self.summary_col.find_one({'_id':check_day})
+            if data is not None:
+                data['stats'] = {unescape_summary_field(field): stats for field, stats in data['stats'].items()}
+        else:
+            data = self._summarize_collection(check_day, check_day + datetime.timedelta(days=1)).get(check_day)
+        if data is None:
+            raise IndexError(f'No data in {date}')
         
+        for stats in data['stats'].values():
+            stats['mean'] = stats['sum'] / stats['count'] if stats['count'] else None
+            
+        return data
     
+    @timed('db_get_data')
     def get_data(self, 
                  initial_datetime:datetime.datetime, 
                  final_datetime:datetime.datetime, 
-                 vars=None, serialized=False) -> pd.DataFrame:
+                 vars=None, serialized=False, resolution=None, aggregation='mean', fill=None) -> pd.DataFrame:
+        """Get data from the database between two dates
+
+        Args:
+            initial_datetime (datetime.datetime): Start of the period
+            final_datetime (datetime.datetime): End of the period
+            vars (list, optional): Variables to retrieve, all available if None or 'all'.
+            serialized (bool, optional): Return the data serialized to json. Defaults to False.
+            resolution (str | float | datetime.timedelta, optional): If given, data is downsampled 
+                in the database to one row per resolution period (see aggregate_dataframe). Defaults to None.
+            aggregation (str, optional): Aggregation used when downsampling. Defaults to 'mean'.
+            fill (str, optional): Fill method for empty buckets when downsampling. Defaults to None.
+
+        Returns:
+            pd.DataFrame: Data indexed by time
+        """
         
-        @self.cache.memoize()
-        def query_and_serialize_data(date_key) -> pd.DataFrame:
-            """ Function that when faced with the same input (date_key), returns cached value.
-                It will only be called once and then return cached value """
-                
+        # Variables to export
+        if vars=='all' or vars==None:
             vars = self.check_available_variables(initial_datetime)
-            vars.append('time')
-            data = self.col.find({'time':{'$lt':final_datetime, '$gt':initial_datetime}}, vars).sort('time', pymongo.ASCENDING)
-            data = pd.DataFrame(iter(data)) # Very slow, need to find a better way to do this
-            
-            # # Chapuzillas https://stackoverflow.com/questions/54825098/datetime-pandas-and-timezone-woes-attributeerror-datetime-timezone-object
-            # data['time'] = pd.to_datetime(data.time.astype(str))
+        vars = [var for var in vars if var not in ['_id', 'time']]
         
-            data.set_index('time', inplace=True)
-            data = data.tz_convert('UTC')
+        if resolution:
+            def query_downsampled_data(date_key, vars_key, downsample_key) -> pd.DataFrame:
+                """ Function that when faced with the same input (date_key, vars_key, downsample_key), 
+                    returns cached value. It will only be called once and then return cached value """
                 
-            data.drop('_id', axis=1, inplace=True)
+                return aggregate_dataframe(self.col, {'time':{'$lt':final_datetime, '$gt':initial_datetime}}, vars, 
+                                           resolution, aggregation=aggregation, fill=fill)
             
+            if getattr(self, 'cache', None) is not None:
+                query_downsampled_data = self.cache.memoize()(query_downsampled_data)
+                
+            # Create a key to uniquely identify the query
+            date_key = f"{initial_datetime.strftime('%Y%m%d%H%M%S')}_{final_datetime.strftime('%Y%m%d%H%M%S')}"
+            vars_key = ','.join(sorted(vars))
+            downsample_key = f'{resolution}_{aggregation}_{fill}'
+                    
+            data = query_downsampled_data(date_key, vars_key, downsample_key)
+        else:
+            # Only the chunks of the range not cached yet are queried
+            data = self.data_cache.get(self.col, initial_datetime, final_datetime, vars)
+            
+        data = data[vars]
+                
+        if serialized:
+            return data.to_json(orient='table')
+        else: 
             return data
         
-        # Create a dictionary with the variables to export        
-        varsToExport = {'_id':0, 'time':1}
+    def iter_data(self, initial_datetime:datetime.datetime, final_datetime:datetime.datetime, 
+                  vars=None, chunk=QUERY_BATCH_SIZE, batch_size=None, arrow=False):
+        """Iterate over the data between two dates in chunks of at most chunk rows, 
+            to export long periods without loading them completely in memory
+
+        Args:
+            initial_datetime (datetime.datetime): Start of the period
+            final_datetime (datetime.datetime): End of the period
+            vars (list, optional): Variables to retrieve, all available if None or 'all'.
+            chunk (int, optional): Maximum number of rows per chunk. Defaults to QUERY_BATCH_SIZE.
+            batch_size (int, optional): Cursor batch size. Defaults to chunk.
+            arrow (bool, optional): Yield pyarrow.RecordBatch instead of DataFrames. Defaults to False.
+
+        Yields:
+            pd.DataFrame | pyarrow.RecordBatch: Data indexed by time
+        """
         if vars=='all' or vars==None:
             vars = self.check_available_variables(initial_datetime)
+        vars = [var for var in vars if var not in ['_id', 'time']]
+        
+        if arrow:
+            import pyarrow as pa
         
-        [varsToExport.update({var:1}) for var in vars]
+        for data in iter_dataframes(self.col, {'time':{'$lt':final_datetime, '$gt':initial_datetime}}, vars, 
+                                    chunk=chunk, batch_size=batch_size):
+            yield pa.RecordBatch.from_pandas(data, preserve_index=True) if arrow else data
             
-        # Create a key to uniquely identify the query
-        date_key = f"{initial_datetime.strftime('%Y%m%d%H%M%S')}_{final_datetime.strftime('%Y%m%d%H%M%S')}"
-                
-        data = query_and_serialize_data(date_key)
+    def export_data(self, path:str, initial_datetime:datetime.datetime, final_datetime:datetime.datetime, 
+                    vars=None, format:str=None, chunk=QUERY_BATCH_SIZE) -> int:
+        """Export the data between two dates to a csv, parquet or ndjson file, 
+            streaming it in chunks so memory usage stays flat regardless of the period
+
+        Returns:
+            int: Number of rows exported
+        """
+        rows = write_dataframes(self.iter_data(initial_datetime, final_datetime, vars=vars, chunk=chunk), path, format=format)
+        self.logger.info(f'Exported {rows} rows to {path}')
         
-        # Filter data to only include the variables specified in varsToExport
-        varsToExport.pop('_id'); varsToExport.pop('time')
-        data = data[list( varsToExport.keys() )]
-        # # Generated by copilot, no idea if it will work:
-        # data = [{k:v for k,v in d.items() if k in varsToExport} for d in data]
-                
-        if serialized:
-            return data.to_json(orient='table')
-        else: 
-            return data
+        return rows
         
+    @timed('db_get_test_days')
     def get_test_days(self, initial_date:datetime.date=None, final_date:datetime.date=None):
-        if not initial_date:
-            intial_date = self.get_oldest_datetime()[0].date()
-        if not final_date:
-            final_date = self.get_newest_datetime()[0].date()
+        """Days with data, optionally limited to the ones between initial_date and final_date"""
+        initial_day = datetime.datetime.combine(initial_date, datetime.time(0,0,0)) if initial_date else datetime.datetime(1970,1,1)
+        final_day = datetime.datetime.combine(final_date, datetime.time(0,0,0)) if final_date else None
+        
+        unique_dates = []
+        complete_until = self._summary_coverage()
+        if complete_until is not None and initial_day < complete_until:
+            query = {'$gte': initial_day, '$lt': complete_until}
+            if final_day:
+                query['$lte'] = final_day
+            results = self.summary_col.find({'_id':query, 'count':{'$gt':0}}, {'_id':1}).sort('_id', pymongo.ASCENDING)
+            unique_dates = [result['_id'] for result in results]
+            initial_day = complete_until
             
-        # Define the aggregation pipeline
+        if final_day is not None and initial_day > final_day:
+            return unique_dates
+        
+        # Days not covered by the summary
+        time_query = {'$gte': initial_day}
+        if final_day:
+            time_query['$lt'] = final_day + datetime.timedelta(days=1)
         pipeline = [
+            {"$match": {"time": time_query}},
             {"$group": {
                 "_id": {"year": {"$year": "$time"}, "month": {"$month": "$time"}, "day": {"$dayOfMonth": "$time"}}
             }},
             {"$project": {
-                "date": {"$dateFromParts": {"year": "$_id.year", "month": "$_id.month", "day": "$_id.day"}},
-                "_id": 0
-            }},
-            {"$group": {
-                "_id": "$date"
+                "_id": {"$dateFromParts": {"year": "$_id.year", "month": "$_id.month", "day": "$_id.day"}},
             }},
             {"$sort": {
                 "_id": 1
             }}
         ]
+        unique_dates += [result['_id'] for result in self.col.aggregate(pipeline)]
+        
+        return unique_dates
+    
+    def update_summary(self, samples):
+        """Update the daily summary with samples inserted in the collection, 
+            it is done automatically for samples inserted with insert_samples, 
+            call it after inserting data by other means (e.g. backfilling)
 
-        # Run the aggregation pipeline
-        results = list(self.col.aggregate(pipeline))
+        Args:
+            samples (list | pd.DataFrame): Inserted samples, with a time key/column
+        """
+        if self.summary_col is None:
+            return
         
-        unique_dates = [result['_id'] for result in results]
+        operations = []
+        for day, day_summary in summarize_samples(samples).items():
+            update = {
+                '$min': {'first_time': day_summary['first_time']},
+                '$max': {'last_time': day_summary['last_time']},
+                '$inc': {'count': day_summary['count']},
+                '$addToSet': {'variables': {'$each': day_summary['variables']}},
+            }
+            for var, stats in day_summary['stats'].items():
+                field = escape_summary_field(var)
+                update['$min'][f'stats.{field}.min'] = stats['min']
+                update['$max'][f'stats.{field}.max'] = stats['max']
+                update['$inc'][f'stats.{field}.sum'] = stats['sum']
+                update['$inc'][f'stats.{field}.count'] = stats['count']
+            if not day_summary['stats']:
+                update['$setOnInsert'] = {'stats': {}}
+                
+            operations.append(UpdateOne({'_id': day}, update, upsert=True))
+            
+        if operations:
+            self.summary_col.bulk_write(operations, ordered=False)
+            
+    def rebuild_summary(self, initial_date:datetime.date=None, final_date:datetime.date=None, 
+                        chunk=QUERY_BATCH_SIZE, background=False):
+        """(Re)build the daily summary from the collection in a single pass, 
+            all days by default or only the ones between initial_date and final_date.
+            Samples inserted in the affected days while rebuilding may not be accounted for.
+            
+            It scans the whole collection, unless build_summary is False it is started 
+            in the background the first time the summary is needed. Until it finishes 
+            the queries that use it scan the collection.
+            
+        Returns:
+            threading.Thread: The thread building the summary if background, otherwise None
+        """
+        if background:
+            return self._start_summary_thread(self.rebuild_summary, initial_date, final_date, chunk)
         
-        return unique_dates
-    
\ No newline at end of file
+        initial_day = datetime.datetime.combine(initial_date, datetime.time(0,0,0)) if initial_date else datetime.datetime(1970,1,1)
+        final_day = datetime.datetime.combine(final_date, datetime.time(0,0,0)) if final_date else None
+        complete_until = self._summary_target()
+        
+        self.logger.info(f'Building daily summary of {self.collection_name}')
+        summary = self._summarize_collection(initial_day, final_day + datetime.timedelta(days=1) if final_day else None, chunk=chunk)
+            
+        day_query = {'$gte': initial_day}
+        if final_day:
+            day_query['$lte'] = final_day
+        self.summary_col.delete_many({'_id': day_query})
+        operations = []
+        for day, day_summary in summary.items():
+            day_summary['stats'] = {escape_summary_field(var): stats for var, stats in day_summary['stats'].items()}
+            operations.append(ReplaceOne({'_id': day}, day_summary, upsert=True))
+        if operations:
+            self.summary_col.bulk_write(operations, ordered=False)
+        if not initial_date and not final_date:
+            self.summary_col.replace_one({'_id': SUMMARY_INFO_ID}, 
+                                         {'built_at': datetime.datetime.now(tz=datetime.timezone.utc),
+                                          'complete_until': complete_until}, upsert=True)
+            self._summary_info = None
+            
+        self.logger.info(f'Daily summary of {self.collection_name} built, {len(summary)} days')
+        
+    def catch_up_summary(self, chunk=QUERY_BATCH_SIZE) -> int:
+        """Summarize the days completed since the summary was last brought up to 
+            date, it is started in the background when the summary is used
+
+        Returns:
+            int: Number of days summarized
+        """
+        info = self.summary_col.find_one({'_id': SUMMARY_INFO_ID})
+        if info is None:
+            raise RuntimeError(f'Daily summary of {self.collection_name} not built, use rebuild_summary')
+        
+        complete_until = self._naive_day(info['complete_until'])
+        target = self._summary_target()
+        if complete_until >= target:
+            return 0
+        
+        final_day = target - datetime.timedelta(days=1)
+        self.rebuild_summary(complete_until.date(), final_day.date(), chunk=chunk)
+        self.summary_col.update_one({'_id': SUMMARY_INFO_ID}, {'$set': {'complete_until': target}})
+        self._summary_info = None
+        
+        return (target - complete_until).days
+    
+    def _summarize_collection(self, initial_datetime=None, final_datetime=None, chunk=QUERY_BATCH_SIZE) -> dict:
+        """Daily summary of the samples in [initial_datetime, final_datetime), in a single pass"""
+        query = {}
+        if initial_datetime:
+            query['$gte'] = initial_datetime
+        if final_datetime:
+            query['$lt'] = final_datetime
+        
+        summary = {}
+        cursor = self.col.find({'time': query} if query else {}, {'_id':0}, batch_size=chunk)
+        try:
+            while True:
+                samples = list(itertools.islice(cursor, chunk))
+                if not samples:
+                    break
+                merge_summaries(summary, summarize_samples(samples))
+        finally:
+            cursor.close()
+            
+        return summary
+    
+    @staticmethod
+    def _naive_day(value) -> datetime.datetime:
+        """Day as a naive UTC midnight datetime, as the _id of the summary documents"""
+        if value.tzinfo is not None:
+            value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        return datetime.datetime.combine(value.date(), datetime.time(0,0,0))
+    
+    def _summary_target(self) -> datetime.datetime:
+        """First day that is not complete yet (it may still receive samples)"""
+        return self._naive_day(datetime.datetime.now(tz=datetime.timezone.utc) - SUMMARY_GRACE)
+        
+    def _summary_coverage(self):
+        """Day up to which (excluded) the daily summary is complete, the rest of 
+            the days have to be queried from the collection. None if the summary 
+            has not been built. Completed days missing from the summary are 
+            summarized in the background"""
+        if self.summary_col is None:
+            return None
+        
+        now = time.monotonic()
+        if self._summary_info is None or now - self._summary_info[1] > self.probe_ttl:
+            self._summary_info = (self.summary_col.find_one({'_id': SUMMARY_INFO_ID}), now)
+        info = self._summary_info[0]
+        
+        if info is None or 'complete_until' not in info:
+            # Built (or warned about) once per instance, a failed build is not retried on every query
+            if not self._summary_warned:
+                self._summary_warned = True
+                if self.build_summary:
+                    self.logger.info(f'Daily summary of {self.collection_name} not built, building it in the background')
+                    self._start_summary_thread(self.rebuild_summary)
+                else:
+                    self.logger.warning(f'Daily summary of {self.collection_name} not built, queries scan the '
+                                        'collection. Build it with rebuild_summary()')
+            return None
+        
+        complete_until = self._naive_day(info['complete_until'])
+        if complete_until < self._summary_target():
+            self._start_summary_thread(self.catch_up_summary)
+            
+        return complete_until
+    
+    def _start_summary_thread(self, target, *args):
+        with self._summary_lock:
+            if self._summary_thread is not None and self._summary_thread.is_alive():
+                return self._summary_thread
+            
+            def run():
+                try:
+                    target(*args)
+                except Exception as e:
+                    self.logger.error(f'Error updating daily summary of {self.collection_name}: {e}')
+            
+            self._summary_thread = threading.Thread(target=run, daemon=True, name=f'db_summary_{self.collection_name}')
+            self._summary_thread.start()
+            
+        return self._summary_thread
+    
+    def insert_samples(self, samples):
+        """Buffer samples to be inserted in the collection. Samples are written in 
+            the background with insert_many(ordered=False) when write_batch_size samples 
+            are buffered or every write_flush_interval seconds, so acquisition loops 
+            never wait for the database.
+
+        Args:
+            samples (dict | list): Sample or list of samples, dictionaries with a 
+                                   time key and one key per variable
+        """
+        if isinstance(samples, dict):
+            samples = [samples]
+            
+        with self._write_lock:
+            # Copies, the caller can reuse its dictionaries while they are buffered
+            self._write_buffer.extend(dict(sample) for sample in samples)
+            
+            overflow = len(self._write_buffer) - self.write_max_buffered
+            if overflow > 0:
+                del self._write_buffer[:overflow]
+                self.write_stats['dropped'] += overflow
+                self.logger.warning(f'Write buffer full, {overflow} oldest samples dropped')
+                
+            buffered = len(self._write_buffer)
+            
+        if self._writer_thread is None or not self._writer_thread.is_alive():
+            self._start_writer()
+            
+        if buffered >= self.write_batch_size:
+            self._write_event.set()
+            
+    def flush(self) -> tuple:
+        """Insert all the buffered samples. Duplicated samples (same time) are 
+            reported but do not prevent the rest of the batch from being inserted
+
+        Returns:
+            tuple: (number of inserted samples, number of duplicated samples)
+        """
+        with self._write_lock:
+            samples, self._write_buffer = self._write_buffer, []
+            
+        if not samples:
+            return 0, 0
+        
+        try:
+            return self.write_samples(samples)
+        
+        except Exception as e:
+            # Keep the samples to retry in the next flush
+            with self._write_lock:
+                self._write_buffer[:0] = samples
+            self.write_stats['errors'] += 1
+            self.logger.error(f'Could not insert samples in {self.collection_name}, will retry: {e}')
+            
+            return 0, 0
+        
+    @timed('db_write_samples', batch_arg='samples')
+    def write_samples(self, samples:list) -> tuple:
+        """Insert samples right away with insert_many(ordered=False), bypassing the 
+            buffer. Duplicated samples (same time) are reported but do not prevent 
+            the rest of the batch from being inserted, other errors are raised
+
+        Returns:
+            tuple: (number of inserted samples, number of duplicated samples)
+        """
+        inserted = 0; duplicates = 0
+        inserted_samples = samples
+        try:
+            # insert_many adds an _id to the documents, insert copies to leave the samples untouched
+            inserted = len(self.col.insert_many([dict(sample) for sample in samples], ordered=False).inserted_ids)
+            
+        except BulkWriteError as e:
+            inserted = e.details.get('nInserted', 0)
+            write_errors = e.details.get('writeErrors', [])
+            failed = {error['index'] for error in write_errors}
+            inserted_samples = [sample for idx, sample in enumerate(samples) if idx not in failed]
+            duplicates = sum(1 for error in write_errors if error.get('code') == 11000)
+            other_errors = len(write_errors) - duplicates
+            
+            if duplicates:
+                self.logger.warning(f'{duplicates} duplicated samples not inserted in {self.collection_name}')
+            if other_errors:
+                self.write_stats['errors'] += other_errors
+                self.logger.error(f'{other_errors} samples could not be inserted in {self.collection_name}: {write_errors[0]["errmsg"]}')
+                
+        if inserted_samples:
+            self.data_cache.touch(inserted_samples)
+            try:
+                self.update_summary(inserted_samples)
+            except Exception as e:
+                self.logger.error(f'Could not update daily summary of {self.collection_name}: {e}')
+            
+        self.write_stats['inserted'] += inserted
+        self.write_stats['duplicates'] += duplicates
+        
+        return inserted, duplicates
+    
+    def close_writer(self, timeout:float=WRITE_CLOSE_TIMEOUT):
+        """Stop the background writer after flushing the buffered samples. If the 
+            writer does not finish in timeout seconds (e.g. stalled connection) 
+            the pending samples are abandoned with a warning"""
+        if self._writer_thread is None:
+            return
+        
+        self._writer_stop = True
+        self._write_event.set()
+        self._writer_thread.join(timeout=timeout)
+        if self._writer_thread.is_alive():
+            self.logger.warning(f'Background writer of {self.collection_name} did not finish in {timeout} s, '
+                                f'the batch being written and {len(self._write_buffer)} buffered samples may be lost')
+            return
+        
+        self._writer_thread = None
+        self.flush()
+    
+    def _start_writer(self):
+        with self._write_lock:
+            if self._writer_thread is not None and self._writer_thread.is_alive():
+                return
+            
+            self._writer_stop = False
+            self._writer_thread = threading.Thread(target=self._writer_loop, daemon=True, 
+                                                   name=f'db_writer_{self.collection_name}')
+            self._writer_thread.start()
+            
+            # Make sure buffered samples are not lost when the process ends
+            if not self._writer_atexit:
+                atexit.register(self.close_writer)
+                self._writer_atexit = True
+            
+    def _writer_loop(self):
+        while not self._writer_stop:
+            self._write_event.wait(timeout=self.write_flush_interval)
+            self._write_event.clear()
+            
+            try:
+                self.flush()
+            except Exception as e:
+                self.logger.error(f'Error in background writer of {self.collection_name}: {e}')
+
+
+class async_database():
+    """asyncio counterpart of database, queries run in a bounded thread pool 
+        so they do not block the event loop (e.g. the one polling OPC UA servers).
+        
+        A wrapped database object does the actual work, so the data cache, 
+        daily summary and shared client are the same as with the blocking API.
+
+        Example:
+            db = await async_database.create(connection_string, 'librescada', 'operation_data')
+            data = await db.get_data(initial_datetime, final_datetime, vars=['TT-DES-001'])
+            await db.insert_samples(samples)
+    """
+    
+    def __init__(self, db:database, max_workers:int=DB_EXECUTOR_WORKERS):
+        self.db = db
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, 
+                                           thread_name_prefix=f'async_db_{db.collection_name}')
+        self.logger = db.logger
+        
+    @classmethod
+    async def create(cls, connection_string, database_name, collection_name, create_if_not_exist=False, 
+                     max_workers:int=DB_EXECUTOR_WORKERS, **kwargs): # __init__ alternative for async classes
+        """Create a new instance, connecting to the database without blocking the event loop"""
+        
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            db = await asyncio.get_running_loop().run_in_executor(
+                executor, functools.partial(database, connection_string, database_name, collection_name, 
+                                            create_if_not_exist=create_if_not_exist, **kwargs)
+            )
+        finally:
+            executor.shutdown(wait=False)
+            
+        return cls(db, max_workers=max_workers)
+    
+    @property
+    def isConnected(self) -> bool:
+        return self.db.isConnected
+        
+    async def _run(self, func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+    
+    async def check_connection(self, return_type='alert'):
+        return await self._run(self.db.check_connection, return_type=return_type)
+    
+    async def get_oldest_datetime(self):
+        return await self._run(self.db.get_oldest_datetime)
+    
+    async def get_newest_datetime(self):
+        return await self._run(self.db.get_newest_datetime)
+    
+    async def check_for_data(self, initial_date, final_date):
+        return await self._run(self.db.check_for_data, initial_date, final_date)
+    
+    async def check_available_variables(self, date):
+        return await self._run(self.db.check_available_variables, date)
+    
+    async def get_test_days(self, initial_date:datetime.date=None, final_date:datetime.date=None):
+        return await self._run(self.db.get_test_days, initial_date, final_date)
+    
+    async def get_data(self, initial_datetime:datetime.datetime, final_datetime:datetime.datetime, vars=None, **kwargs) -> pd.DataFrame:
+        """See database.get_data"""
+        return await self._run(self.db.get_data, initial_datetime, final_datetime, vars=vars, **kwargs)
+    
+    async def insert_samples(self, samples) -> tuple:
+        """Insert samples in bulk (see database.flush), waiting until they are written
+
+        Returns:
+            tuple: (number of inserted samples, number of duplicated samples)
+        """
+        if isinstance(samples, dict):
+            samples = [samples]
+            
+        return await self._run(self._insert_samples, list(samples))
+    
+    def _insert_samples(self, samples:list) -> tuple:
+        inserted = 0; duplicates = 0
+        for idx in range(0, len(samples), self.db.write_batch_size):
+            batch_inserted, batch_duplicates = self.db.write_samples(samples[idx:idx+self.db.write_batch_size])
+            inserted += batch_inserted; duplicates += batch_duplicates
+            
+        return inserted, duplicates
+    
+    async def close(self):
+        """Flush the buffered writer of the wrapped database and stop the thread pool"""
+        await self._run(self.db.close_writer)
+        self.executor.shutdown(wait=True)
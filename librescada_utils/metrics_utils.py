@@ -0,0 +1,225 @@
+import os
+import time
+import bisect
+import inspect
+import logging
+import functools
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Metrics are disabled by default, enable them with LIBRESCADA_METRICS=1 before importing 
+# librescada_utils. When disabled functions are not even wrapped, so there is no overhead
+METRICS_ENABLED = os.getenv('LIBRESCADA_METRICS', '0').lower() in ['1', 'true', 'yes']
+METRICS_PREFIX = 'librescada_'
+
+# Upper bounds of the histogram buckets
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30) # seconds
+BATCH_SIZE_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+
+class histogram():
+    """Cumulative histogram with fixed buckets, as exposed by Prometheus"""
+
+    def __init__(self, buckets:tuple):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # Last one is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value:float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> list:
+        counts = []; total = 0
+        for count in self.counts:
+            total += count
+            counts.append(total)
+        return counts
+
+class metrics_registry():
+    """Counters and histograms of the calls of librescada_utils, exported in
+        the Prometheus text format (to_prometheus or start_http_server)
+
+        Metrics are identified by name and optional labels. Functions are
+        instrumented with the timed decorator, which records:
+            - <name>_seconds: latency histogram
+            - <name>_errors_total: calls that raised an exception
+            - <name>_batch_size: histogram of the size of the batch argument, if given
+
+        Functions are only wrapped if the registry is instrumented (METRICS_ENABLED 
+        when they are imported), otherwise timed returns them unchanged. Recording 
+        can then be paused at runtime with registry.enabled = False, which costs 
+        one attribute check per call.
+
+    Example:
+        # LIBRESCADA_METRICS=1 python service.py
+        from librescada_utils.metrics_utils import registry
+        registry.start_http_server(9100)  # or registry.to_prometheus()
+    """
+
+    def __init__(self, enabled:bool=METRICS_ENABLED, prefix:str=METRICS_PREFIX):
+        self.instrument = enabled
+        self.enabled = enabled
+        self.prefix = prefix
+        self.counters = {}   # (name, labels) -> value
+        self.histograms = {} # (name, labels) -> histogram
+        self.help = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def inc(self, name:str, value:float=1, help:str=None, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+            if help: self.help.setdefault(name, help)
+
+    def observe(self, name:str, value:float, buckets:tuple=LATENCY_BUCKETS, help:str=None, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = histogram(buckets)
+            hist.observe(value)
+            if help: self.help.setdefault(name, help)
+
+    def clear(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def timed(self, name:str, batch_arg:str=None, **labels):
+        """Decorator that records latency, errors and batch size of the calls of a
+            function or coroutine function
+
+        Args:
+            name (str): Metric base name
+            batch_arg (str, optional): Argument whose len() is recorded as batch size.
+            **labels: Constant labels of the metrics
+        """
+        def decorator(func):
+            if not self.instrument:
+                return func
+            
+            batch_idx = None
+            if batch_arg is not None:
+                batch_idx = list(inspect.signature(func).parameters).index(batch_arg)
+
+            def record(start, args, kwargs, error):
+                self.observe(f'{name}_seconds', time.perf_counter() - start,
+                             help=f'Latency of {name} calls in seconds', **labels)
+                if error:
+                    self.inc(f'{name}_errors_total', help=f'{name} calls that raised an exception', **labels)
+                if batch_idx is not None:
+                    batch = args[batch_idx] if len(args) > batch_idx else kwargs.get(batch_arg)
+                    if hasattr(batch, '__len__'):
+                        self.observe(f'{name}_batch_size', len(batch), buckets=BATCH_SIZE_BUCKETS,
+                                     help=f'Size of {batch_arg} in {name} calls', **labels)
+
+            if inspect.iscoroutinefunction(func):
+                @functools.wraps(func)
+                async def wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return await func(*args, **kwargs)
+
+                    start = time.perf_counter(); error = True
+                    try:
+                        result = await func(*args, **kwargs)
+                        error = False
+                        return result
+                    finally:
+                        record(start, args, kwargs, error)
+            else:
+                @functools.wraps(func)
+                def wrapper(*args, **kwargs):
+                    if not self.enabled:
+                        return func(*args, **kwargs)
+
+                    start = time.perf_counter(); error = True
+                    try:
+                        result = func(*args, **kwargs)
+                        error = False
+                        return result
+                    finally:
+                        record(start, args, kwargs, error)
+
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    def _format_labels(labels:tuple, extra:tuple=()) -> str:
+        labels = labels + extra
+        if not labels:
+            return ''
+        escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in labels]
+        return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+    def to_prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+
+            described = set()
+            for (name, labels), value in counters:
+                metric = self.prefix + name
+                if metric not in described:
+                    described.add(metric)
+                    if name in self.help: lines.append(f'# HELP {metric} {self.help[name]}')
+                    lines.append(f'# TYPE {metric} counter')
+                lines.append(f'{metric}{self._format_labels(labels)} {value}')
+
+            for (name, labels), hist in histograms:
+                metric = self.prefix + name
+                if metric not in described:
+                    described.add(metric)
+                    if name in self.help: lines.append(f'# HELP {metric} {self.help[name]}')
+                    lines.append(f'# TYPE {metric} histogram')
+                for bound, count in zip(list(hist.buckets) + ['+Inf'], hist.cumulative_counts()):
+                    lines.append(f'{metric}_bucket{self._format_labels(labels, (("le", bound),))} {count}')
+                lines.append(f'{metric}_sum{self._format_labels(labels)} {hist.sum}')
+                lines.append(f'{metric}_count{self._format_labels(labels)} {hist.count}')
+
+        return '\n'.join(lines) + '\n'
+
+    def start_http_server(self, port:int=9100, addr:str='127.0.0.1'):
+        """Serve the metrics at http://addr:port/metrics from a daemon thread,
+            enabling the recording
+
+        Returns:
+            http.server.ThreadingHTTPServer: Server, stop it with shutdown()
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        registry = self
+        class metrics_handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ['/', '/metrics']:
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        if not self.instrument:
+            logger.warning('Metrics are not instrumented, set LIBRESCADA_METRICS=1 before importing librescada_utils')
+        self.enabled = True
+        self._server = ThreadingHTTPServer((addr, port), metrics_handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True, name='metrics_http_server').start()
+        logger.info(f'Metrics available at http://{addr}:{port}/metrics')
+
+        return self._server
+
+# Process wide registry used by the instrumented functions
+registry = metrics_registry()
+timed = registry.timed
@@ -6,16 +6,489 @@ from asyncua.sync import Client as syncClient
 from asyncua import Server as asyncServer
 from asyncua.sync import SyncNode
 from asyncua.crypto.security_policies import SecurityPolicyBasic256Sha256
+from asyncua.common.ua_utils import value_to_datavalue
 
 import datetime
+import hashlib
+import inspect
+import json
 import logging
+import math
+import os
+import time
 from collections import deque
 from pprint import pprint
 
-from . import flatten_dict
+from . import flatten_dict, flat_dict_view, fix_path
+from .metrics_utils import timed, registry
 
 logger = logging.getLogger(__name__)
 
+# Server capability nodes with the maximum number of nodes allowed per service call
+OPERATION_LIMITS = {
+    'read':   ua.ObjectIds.Server_ServerCapabilities_OperationLimits_MaxNodesPerRead,
+    'write':  ua.ObjectIds.Server_ServerCapabilities_OperationLimits_MaxNodesPerWrite,
+    'browse': ua.ObjectIds.Server_ServerCapabilities_OperationLimits_MaxNodesPerBrowse,
+}
+# Maximum number of concurrent requests in flight when browsing the server
+MAX_CONCURRENT_REQUESTS = 8
+# Default directory where the browsed server structures are cached
+STRUCTURE_CACHE_DIR = os.getenv('LIBRESCADA_CACHE_DIR', '~/.cache/librescada')
+
+
+def to_nodeid(node):
+    """Convert any of the node representations used in librescada (asyncua.Node,
+    SyncNode, NodeId or node string as stored in opcTag_list) to a ua.NodeId
+
+    Returns:
+        ua.NodeId: NodeId of the node or None if the node is not valid (e.g. [] or '')
+    """
+    if isinstance(node, ua.NodeId):
+        return node
+    if isinstance(node, (Node, SyncNode)):
+        return node.nodeid
+    if isinstance(node, str) and node and node != '[]':
+        try:
+            return ua.NodeId.from_string(node)
+        except Exception:
+            logger.warning(f'Could not parse node id from string: {node}')
+
+    return None
+
+async def get_operation_limits(opc_client) -> dict:
+    """Read the operation limits of the server (MaxNodesPerRead, MaxNodesPerWrite, ...)
+        in a single call. They are cached in the client so they are only retrieved once
+        per client instance. A value of 0 means that the server does not impose a limit
+
+    Args:
+        opc_client (asyncua.Client): async client (for sync clients use its aio_obj)
+
+    Returns:
+        dict: {'read': int, 'write': int, 'browse': int}
+    """
+    limits = getattr(opc_client, 'operation_limits', None)
+    if limits is not None:
+        return limits
+
+    limits = {key: 0 for key in OPERATION_LIMITS}
+    try:
+        nodeids = [ua.NodeId(object_id) for object_id in OPERATION_LIMITS.values()]
+        results = await opc_client.uaclient.read_attributes(nodeids, ua.AttributeIds.Value)
+        for key, result in zip(OPERATION_LIMITS, results):
+            if result.StatusCode.is_good() and result.Value.Value:
+                limits[key] = int(result.Value.Value)
+    except Exception as e:
+        logger.warning(f'Could not read operation limits from server, assuming no limits: {e}')
+
+    opc_client.operation_limits = limits
+
+    return limits
+
+def chunks(items:list, size:int):
+    """Split a list in chunks of at most size elements, size=0 means no limit"""
+    if not size:
+        size = max(len(items), 1)
+
+    for start in range(0, len(items), size):
+        yield items[start:start+size]
+
+async def read_datavalues(opc_client, nodes:list, attribute=ua.AttributeIds.Value) -> list:
+    """Read an attribute of multiple nodes using as few Read service calls as possible,
+        one per chunk of MaxNodesPerRead nodes.
+
+    Args:
+        opc_client (asyncua.Client): async client (for sync clients use its aio_obj)
+        nodes (list): Nodes in any format supported by to_nodeid
+        attribute (ua.AttributeIds, optional): Attribute to read. Defaults to Value.
+
+    Returns:
+        list: DataValue for each node in the same order as the input, None for
+        invalid nodes or nodes whose status code is not good
+    """
+    nodeids = [to_nodeid(node) for node in nodes]
+    results = [None] * len(nodeids)
+    valid = [(idx, nodeid) for idx, nodeid in enumerate(nodeids) if nodeid is not None]
+    if not valid:
+        return results
+
+    limits = await get_operation_limits(opc_client)
+    for chunk in chunks(valid, limits['read']):
+        datavalues = await opc_client.uaclient.read_attributes([nodeid for _, nodeid in chunk], attribute)
+        for (idx, nodeid), dv in zip(chunk, datavalues):
+            if dv.StatusCode.is_good():
+                results[idx] = dv
+            else:
+                logger.debug(f'Bad status reading node {nodeid.to_string()}: {dv.StatusCode}')
+
+    return results
+
+async def write_datavalues(opc_client, nodes:list, values:list, attribute=ua.AttributeIds.Value) -> list:
+    """Write an attribute of multiple nodes using as few Write service calls as possible,
+        one per chunk of MaxNodesPerWrite nodes.
+
+    Args:
+        opc_client (asyncua.Client): async client (for sync clients use its aio_obj)
+        nodes (list): Nodes in any format supported by to_nodeid
+        values (list): Values or ua.DataValue objects to write, one per node
+        attribute (ua.AttributeIds, optional): Attribute to write. Defaults to Value.
+
+    Returns:
+        list: ua.StatusCode for each node in the same order as the input,
+        BadNodeIdInvalid for nodes that could not be resolved
+    """
+    if len(nodes) != len(values):
+        raise ValueError(f'Number of nodes ({len(nodes)}) and values ({len(values)}) do not match')
+    
+    nodeids = [to_nodeid(node) for node in nodes]
+    results = [ua.StatusCode(ua.StatusCodes.BadNodeIdInvalid)] * len(nodeids)
+    valid = [(idx, nodeid, value_to_datavalue(value)) for idx, (nodeid, value) in enumerate(zip(nodeids, values)) if nodeid is not None]
+    if not valid:
+        return results
+
+    limits = await get_operation_limits(opc_client)
+    for chunk in chunks(valid, limits['write']):
+        status_codes = await opc_client.uaclient.write_attributes([nodeid for _, nodeid, _ in chunk],
+                                                                  [dv for _, _, dv in chunk], attribute)
+        for (idx, nodeid, _), status_code in zip(chunk, status_codes):
+            results[idx] = status_code
+            if not status_code.is_good():
+                logger.warning(f'Bad status writing node {nodeid.to_string()}: {status_code}')
+
+    return results
+
+async def browse_nodes(opc_client, nodeids:list, semaphore:asyncio.Semaphore=None) -> list:
+    """Browse the hierarchical references of multiple nodes in a single Browse call,
+        following continuation points until all references are retrieved.
+
+    Args:
+        opc_client (asyncua.Client): async client (for sync clients use its aio_obj)
+        nodeids (list): NodeIds of the nodes to browse
+        semaphore (asyncio.Semaphore, optional): Used to limit the number of requests in flight
+
+    Returns:
+        list: For each input node, a list of ua.ReferenceDescription of its children
+    """
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(1)
+    
+    params = ua.BrowseParameters()
+    params.View = ua.ViewDescription()
+    params.RequestedMaxReferencesPerNode = 0
+    for nodeid in nodeids:
+        desc = ua.BrowseDescription()
+        desc.NodeId = nodeid
+        desc.BrowseDirection = ua.BrowseDirection.Forward
+        desc.ReferenceTypeId = ua.NodeId(ua.ObjectIds.HierarchicalReferences)
+        desc.IncludeSubtypes = True
+        desc.NodeClassMask = ua.NodeClass.Unspecified
+        desc.ResultMask = ua.BrowseResultMask.BrowseName
+        params.NodesToBrowse.append(desc)
+    
+    async with semaphore:
+        results = await opc_client.uaclient.browse(params)
+    
+    references = []
+    for nodeid, result in zip(nodeids, results):
+        if not result.StatusCode.is_good():
+            logger.warning(f'Bad status browsing node {nodeid.to_string()}: {result.StatusCode}')
+            references.append([])
+            continue
+        
+        node_references = list(result.References)
+        continuation_point = result.ContinuationPoint
+        while continuation_point:
+            next_params = ua.BrowseNextParameters()
+            next_params.ReleaseContinuationPoints = False
+            next_params.ContinuationPoints = [continuation_point]
+            async with semaphore:
+                next_result = (await opc_client.uaclient.browse_next(next_params))[0]
+            node_references.extend(next_result.References)
+            continuation_point = next_result.ContinuationPoint
+        
+        references.append(node_references)
+        
+    return references
+
+async def browse_tree(opc_client, root_nodeid, max_depth=None, exclude=('Server', 'Aliases'), 
+                      max_concurrency=MAX_CONCURRENT_REQUESTS) -> dict:
+    """Breadth-first browse of the address space below root_nodeid. Every level of 
+        the tree is browsed at once, with one Browse request per chunk of MaxNodesPerBrowse 
+        nodes and at most max_concurrency requests in flight. Browse names are taken from 
+        the reference descriptions so no additional reads are needed.
+
+    Args:
+        opc_client (asyncua.Client): async client (for sync clients use its aio_obj)
+        root_nodeid (ua.NodeId): Node to start browsing from
+        max_depth (int, optional): Number of levels to browse, None to browse the whole tree
+        exclude (tuple, optional): Browse names of nodes that are skipped (with their children)
+        max_concurrency (int, optional): Maximum number of Browse requests in flight
+
+    Returns:
+        dict: {nodeid: [(browse_name, child_nodeid), ...]} for every browsed node
+    """
+    limits = await get_operation_limits(opc_client)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    
+    tree = {}
+    level = [root_nodeid]; depth = 0
+    while level and (max_depth is None or depth < max_depth):
+        results = await asyncio.gather(*[browse_nodes(opc_client, chunk, semaphore) 
+                                         for chunk in chunks(level, limits['browse'])])
+        
+        next_level = []
+        for nodeid, references in zip(level, [refs for chunk in results for refs in chunk]):
+            tree[nodeid] = [(ref.BrowseName.Name, ref.NodeId) for ref in references 
+                            if ref.BrowseName.Name not in exclude]
+            next_level.extend(child_id for _, child_id in tree[nodeid] if child_id not in tree)
+            
+        level = next_level; depth += 1
+        
+    return tree
+
+def build_server_structure(tree:dict, root_nodeid, make_node) -> dict:
+    """Build the three level (object - folder - variable) server structure 
+        returned by get_server_structure from a tree generated by browse_tree
+
+    Args:
+        tree (dict): Output of browse_tree with at least max_depth=3
+        root_nodeid (ua.NodeId): Root node used in browse_tree (normally Objects)
+        make_node (callable): Function that creates a node object from a NodeId
+
+    Returns:
+        dict: Server structure
+    """
+    objs = {}
+    
+    for obj_name, obj_id in tree.get(root_nodeid, []):
+        objs[obj_name] = {'name':obj_name, 'node':make_node(obj_id), 'children':{}}
+        
+        for child_name, child_id in tree.get(obj_id, []):
+            objs[obj_name]['children'][child_name] = {'name':child_name, 'node':make_node(child_id)}
+            
+            grandchildren = tree.get(child_id, [])
+            if grandchildren: # Folder
+                objs[obj_name]['children'][child_name]['children'] = {
+                    name: {'name':name, 'node':make_node(nodeid)} for name, nodeid in grandchildren
+                }
+                
+    return objs
+
+def structure_cache_file(url:str, uri:str, cache_dir:str=None) -> str:
+    """Path of the file used to cache the structure of the server at url with namespace uri"""
+    key = hashlib.sha1(f'{url}|{uri}'.encode()).hexdigest()[:16]
+    
+    return os.path.join(fix_path(cache_dir or STRUCTURE_CACHE_DIR), f'server_structure_{key}.json')
+
+def structure_fingerprint(namespaces:list, tree:dict=None, root_nodeid=None, version=None) -> str:
+    """Fingerprint used to validate a cached server structure. If the server exposes 
+        a structure version it is used together with the NamespaceArray, otherwise the 
+        objects and their direct children (names, node ids and number of children) are used.
+        Since objects are recreated with new node ids when modified, it is enough 
+        to detect most changes browsing only two levels. Variables added to an 
+        existing folder are not detected, find_nodes browses the server again 
+        when a variable is not found in a cached structure"""
+    parts = [str(namespace) for namespace in namespaces]
+    
+    if version is not None:
+        parts.append(f'version={version}')
+    else:
+        for obj_name, obj_id in tree.get(root_nodeid, []):
+            children = tree.get(obj_id, [])
+            parts.append(f'{obj_name}={obj_id.to_string()}:{len(children)}')
+            parts.extend(f'{obj_name}/{child_name}={child_id.to_string()}' for child_name, child_id in children)
+            
+    return hashlib.sha1('\n'.join(parts).encode()).hexdigest()
+
+def load_structure_cache(cache_file:str):
+    """Load a server structure cache file, returns (fingerprint, tree) or None if not available"""
+    try:
+        with open(cache_file, 'r') as f:
+            cache = json.load(f)
+        
+        tree = {ua.NodeId.from_string(nodeid): [(name, ua.NodeId.from_string(child_id)) for name, child_id in children]
+                for nodeid, children in cache['tree'].items()}
+        
+        return cache['fingerprint'], tree
+    
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f'Could not load server structure cache {cache_file}: {e}')
+        return None
+
+def save_structure_cache(cache_file:str, fingerprint:str, tree:dict, url:str=None, uri:str=None):
+    """Store a browse tree in a cache file, written to a temporary file first so 
+        processes starting at the same time never read a partial file"""
+    cache = {
+        'url': url,
+        'uri': uri,
+        'fingerprint': fingerprint,
+        'tree': {nodeid.to_string(): [(name, child_id.to_string()) for name, child_id in children] 
+                 for nodeid, children in tree.items()},
+    }
+    
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        tmp_file = f'{cache_file}.{os.getpid()}.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        logger.warning(f'Could not save server structure cache {cache_file}: {e}')
+
+async def get_cached_tree(opc_client, url:str, uri:str, cache_dir:str=None, version_nodeid=None, 
+                          refresh=False, return_browsed=False):
+    """Return the three level browse tree of the server, taken from the on-disk cache 
+        if its fingerprint matches the current one in the server, otherwise the server 
+        is browsed and the cache updated.
+
+    Args:
+        opc_client (asyncua.Client): async client (for sync clients use its aio_obj)
+        url (str): Url of the server, used to identify the cache
+        uri (str): Namespace uri, used to identify the cache
+        cache_dir (str, optional): Cache directory. Defaults to STRUCTURE_CACHE_DIR.
+        version_nodeid (str, optional): Node with a structure version maintained by the server.
+        refresh (bool, optional): Ignore the cache and browse the server.
+        return_browsed (bool, optional): Also return whether the server was browsed.
+
+    Returns:
+        dict: Browse tree as returned by browse_tree, (tree, browsed) if return_browsed
+    """
+    root_nodeid = ua.NodeId(ua.ObjectIds.ObjectsFolder)
+    cache_file = structure_cache_file(url, uri, cache_dir)
+    namespaces = await opc_client.get_namespace_array()
+    
+    version = None
+    if version_nodeid:
+        try:
+            version = await opc_client.get_node(version_nodeid).read_value()
+        except Exception as e:
+            logger.warning(f'Could not read structure version node {version_nodeid}, browsing server: {e}')
+            refresh = True
+    
+    if not refresh:
+        cached = load_structure_cache(cache_file)
+        if cached:
+            if version is not None:
+                fingerprint = structure_fingerprint(namespaces, version=version)
+            else:
+                fingerprint = structure_fingerprint(namespaces, await browse_tree(opc_client, root_nodeid, max_depth=2), root_nodeid)
+                
+            if cached[0] == fingerprint:
+                logger.info(f'Server structure loaded from cache {cache_file}')
+                return (cached[1], False) if return_browsed else cached[1]
+            
+            logger.info('Server structure changed since it was cached, browsing server')
+    
+    tree = await browse_tree(opc_client, root_nodeid, max_depth=3)
+    fingerprint = structure_fingerprint(namespaces, tree, root_nodeid, version=version)
+    save_structure_cache(cache_file, fingerprint, tree, url=url, uri=uri)
+    
+    return (tree, True) if return_browsed else tree
+
+class server_structure_index():
+    """Index of the nodes in a server structure (as returned by get_server_structure)
+        so variables can be looked up by name in constant time instead of scanning 
+        every object and folder.
+        
+        Lookup priority follows the one used historically by find_nodes: objects are 
+        searched in order, and within an object its direct children take precedence 
+        over the children of its folders. Names found in more than one place are
+        recorded so ambiguous lookups can be detected.
+    """
+    
+    def __init__(self, server_structure:dict):
+        self.structure = server_structure
+        
+        self.by_path = {}    # (object, folder, name) -> node, folder is '' for direct children of an object
+        self.by_object = {}  # (object, name) -> node
+        self.by_name = {}    # name -> node
+        self.paths = {}      # name -> [(object, folder), ...]
+        
+        for obj_name, obj in server_structure.items():
+            obj_children = obj.get('children', {})
+            
+            # Direct children first, then the children of the folders
+            for child_name, child in obj_children.items():
+                self._add(obj_name, '', child_name, child['node'])
+                
+            for folder_name, folder in obj_children.items():
+                for child_name, child in folder.get('children', {}).items():
+                    self._add(obj_name, folder_name, child_name, child['node'])
+                    
+    def _add(self, obj_name, folder_name, name, node):
+        self.by_path[(obj_name, folder_name, name)] = node
+        self.by_object.setdefault((obj_name, name), node)
+        self.by_name.setdefault(name, node)
+        self.paths.setdefault(name, []).append((obj_name, folder_name))
+        
+    def ambiguous(self, name:str, object='') -> list:
+        """Return the (object, folder) paths where name is found if there is more 
+            than one within the scope of the lookup (the whole server or one object), 
+            otherwise an empty list"""
+        paths = [path for path in self.paths.get(name, []) if not object or path[0] == object]
+        
+        return paths if len(paths) > 1 else []
+    
+    def find(self, name:str, object='', folder=''):
+        """Return the node for name or None if not found"""
+        if folder:
+            return self.by_path.get((object, folder, name))
+        elif object:
+            return self.by_object.get((object, name))
+        else:
+            return self.by_name.get(name)
+        
+    def find_nodes(self, var_list:list, object='', folder='', strict=False) -> list:
+        """Resolve a list of variable names, returning for each one its node 
+            or [] if not found (same contract as find_nodes)
+
+        Args:
+            var_list (list): Names of the variables to find
+            object (str, optional): Only look in this object.
+            folder (str, optional): Only look in this folder of object.
+            strict (bool, optional): Raise an error if a name is ambiguous. Defaults to False.
+
+        Raises:
+            ValueError: If strict and a name is found in more than one place
+
+        Returns:
+            list: Nodes of the variables
+        """
+        var_nodes = []
+        for var_name in var_list:
+            node = self.find(var_name, object, folder)
+            
+            if node is None:
+                var_nodes.append([])
+                logger.info(f'Node for variable {var_name} could not be found on server')
+                continue
+            
+            if not folder:
+                paths = self.ambiguous(var_name, object)
+                if paths:
+                    if strict:
+                        raise ValueError(f'Variable {var_name} found in several locations: {paths}')
+                    logger.debug(f'Variable {var_name} found in several locations {paths}, using the first one')
+                
+            var_nodes.append(node)
+                
+        return var_nodes
+
+# Index of the last server structure used in findNodes_sync / async_findNodes
+_structure_index = None
+
+def get_structure_index(server_structure:dict) -> server_structure_index:
+    """Return the index for server_structure, it is only rebuilt when a 
+        different structure is given. Structures should not be modified in place 
+        after being indexed"""
+    global _structure_index
+    
+    if _structure_index is None or _structure_index.structure is not server_structure:
+        _structure_index = server_structure_index(server_structure)
+        
+    return _structure_index
+
 
 class uaclient_librescada(asyncClient):
     """
@@ -57,8 +530,15 @@ class uaclient_librescada(asyncClient):
             self.set_user('admin')
         
         self.server_structure = None
+        self.structure_refreshed = False # Browsed from the server, not loaded from the cache
+        # Browsed server structure is cached on disk if the server maintains a structure version 
+        # node (cheap to validate) or if enabled in the configuration, see get_cached_tree
+        self.structure_version_node = ua_parameters.get('structure_version_node', None)
+        self.cache_structure = ua_parameters.get('cache_structure', self.structure_version_node is not None)
+        self.structure_cache_dir = ua_parameters.get('structure_cache_dir', None)
         self.default_retry_time = 10
         self.default_max_retries = 100
+        self.subscriptions = {}
         
         return self
     
@@ -73,9 +553,13 @@ class uaclient_librescada(asyncClient):
         
         self.logger.info(f'Connected to server {self.url}')
     
-    async def get_server_structure(self):
+    @timed('opc_get_server_structure', client='uaclient_librescada')
+    async def get_server_structure(self, refresh=False):
         """ 
         Function that returns the structure of the server in a dictionary.
+        - If cache_structure is enabled (by default only with a structure_version_node), 
+          the structure is loaded from the on-disk cache as long as it is still valid, 
+          refresh=True forces browsing the server
         - Duplicates IDs are allowed as long as not within the same tree level
         - Three levels of hierarchy are supported (user_object - folder - variable)
         - Structure expected for the OPC server: 
@@ -134,67 +618,60 @@ class uaclient_librescada(asyncClient):
                             - output_id: FT-AQU-101a (string)
         """
         
-        object_nodes = await self.nodes.objects.get_children()
+        root_nodeid = self.nodes.objects.nodeid
+        if self.cache_structure:
+            tree, browsed = await get_cached_tree(self, self.url, self.uri, cache_dir=self.structure_cache_dir,
+                                                  version_nodeid=self.structure_version_node, refresh=refresh, 
+                                                  return_browsed=True)
+        else:
+            tree, browsed = await browse_tree(self, root_nodeid, max_depth=3), True
+        objs = build_server_structure(tree, root_nodeid, self.get_node)
 
-        objs = {}
-        
-        for obj in object_nodes:
-            name = await obj.read_browse_name()
-            if name.Name != 'Server' and name.Name != 'Aliases':
-                objs[name.Name] = {'name':name.Name, 'node':obj}
-            
-        for obj in objs:     # Look in each object or the one specfied (measurements, inputs, controllers, etc)
-            obj_children = await objs[obj]['node'].get_children()
-            objs[obj]['children'] = {}
-            for obj_child in obj_children:
-                obj_child_name = await obj_child.read_browse_name()
-                objs[obj]['children'][obj_child_name.Name] = {'name':obj_child_name.Name, 'node':obj_child}
-                
-                obj_child_children = await obj_child.get_children()
-                if len(obj_child_children)>0: # Folder
-                    objs[obj]['children'][obj_child_name.Name]['children'] = {}
-                    for obj_child_child in obj_child_children:
-                        obj_child_child_name = await obj_child_child.read_browse_name()
-                        objs[obj]['children'][obj_child_name.Name]['children'][obj_child_child_name.Name] = {'name':obj_child_child_name.Name, 'node':obj_child_child}                
-                    
         self.server_structure = objs
+        self.structure_refreshed = browsed
         
         return objs
     
     async def explore_node(self, node, just_structure=False, just_nodes=False):
+        """Recursively explore the children of a node, the whole subtree is browsed 
+            level by level with browse_tree and then converted to a nested dictionary"""
         
-        result = {}
+        tree = await browse_tree(self, node.nodeid)
         
-        children = await node.get_children()
-
-        for child in children:
-            child_name = (await child.read_browse_name()).Name
-            if child_name not in ['Server', 'Aliases']:
-                
-                child_children = await child.get_children()
+        def build(nodeid):
+            result = {}
+            
+            for child_name, child_id in tree.get(nodeid, []):
+                child_children = tree.get(child_id)
                 
                 if not child_children:
                     if just_structure:
                         result[child_name] = None
                     elif just_nodes:
-                        result[child_name] = child
+                        result[child_name] = self.get_node(child_id)
                     else:
-                        result[child_name] = {'name': child_name, 'node': child}
+                        result[child_name] = {'name': child_name, 'node': self.get_node(child_id)}
                     
                 else:
                     if just_structure or just_nodes:
-                        result[child_name] = await self.explore_node(child, just_structure, just_nodes)
+                        result[child_name] = build(child_id)
                     else:
                         if not child_name in result:
-                            result[child_name] = {'name': child_name, 'node': child}
-                        result[child_name]['children'] = await self.explore_node(child, just_structure, just_nodes)
-
-
+                            result[child_name] = {'name': child_name, 'node': self.get_node(child_id)}
+                        result[child_name]['children'] = build(child_id)
+                        
+            return result
             
-        return result
+        return build(node.nodeid)
     
     async def get_server_structure2(self, just_structure=False, just_nodes=False, flattened=False):
+        """
+        Structure of the whole server below Objects, see explore_node.
         
+        flattened=True returns it flattened with flatten_dict, flattened='view' 
+        returns a flat_dict_view instead, which has the same keys but does not 
+        copy the structure (lookups walk the nested dict)
+        """
         
         objects_node = self.nodes.objects
         
@@ -204,6 +681,8 @@ class uaclient_librescada(asyncClient):
             if not just_structure and not just_nodes:
                 raise ValueError('Flattening only supported for just_structure=True or just_nodes=True')
             # if just_structure:
+            elif flattened == 'view':
+                server_structure = flat_dict_view(server_structure)
             else:
                 server_structure = flatten_dict(server_structure)
 
@@ -211,6 +690,7 @@ class uaclient_librescada(asyncClient):
         
         return server_structure
     
+    @timed('opc_reconnect', client='uaclient_librescada')
     async def reconnect(self, retry_time=None, max_retries=None):
         if not retry_time:
             retry_time = self.default_retry_time
@@ -272,6 +752,9 @@ class uaclient_librescada(asyncClient):
         """
         
         async def setup_object(object_name:str, include_online:bool, delete_if_exists:bool, include_active:bool) -> asyncua.Node:
+            online_node = None
+            active_node = None
+            
             # Retrieve or create object
             found, obj = await self.check_object_in_server(object_name)
             if found:
@@ -320,15 +803,15 @@ class uaclient_librescada(asyncClient):
         if type=='gateway':
             # Retrieve or create measurements object
             object_name = 'measurements'
-            meas_obj = await setup_object(object_name, include_online=False, delete_if_exists=False, include_active=False)
+            meas_obj, _, _ = await setup_object(object_name, include_online=False, delete_if_exists=False, include_active=False)
 
             # Retrieve or create inputs object
             object_name = 'inputs'
-            inputs_obj = await setup_object(object_name, include_online=False, delete_if_exists=False, include_active=False)
+            inputs_obj, _, _ = await setup_object(object_name, include_online=False, delete_if_exists=False, include_active=False)
 
             # Retrieve or create gateways object
             object_name = 'gateways'
-            gateways_obj = await setup_object(object_name, include_online=True, delete_if_exists=True, include_active=False)
+            gateways_obj, _, _ = await setup_object(object_name, include_online=True, delete_if_exists=True, include_active=False)
 
             return meas_obj, inputs_obj, gateways_obj
         
@@ -373,13 +856,13 @@ class uaclient_librescada(asyncClient):
         
         elif type=='signal_generator':
             object_name = 'signal_generator'
-            obj, online_node = await setup_object(object_name, include_online=True, delete_if_exists=True, include_active=False)
+            obj, online_node, _ = await setup_object(object_name, include_online=True, delete_if_exists=True, include_active=False)
                 
             return obj, online_node
         
         elif type=='finite_state_machines':
             object_name = 'finite_state_machines'
-            obj, online_node = await setup_object(object_name, include_online=True, delete_if_exists=True)
+            obj, online_node, _ = await setup_object(object_name, include_online=True, delete_if_exists=True, include_active=False)
                 
             return obj, online_node
         
@@ -483,7 +966,7 @@ class uaclient_librescada(asyncClient):
             """
             if existing_obj and not delete_if_exists:
                 try:
-                    folder_node = [child for child in parent_node.get_children() if child.get_browse_name().Name == var_name][0]
+                    folder_node = [child for child in await parent_node.get_children() if (await child.read_browse_name()).Name == var_name][0]
                 except IndexError:
                     raise ValueError(f'Folder {var_name} not found in {object_name}')
             else:
@@ -494,13 +977,13 @@ class uaclient_librescada(asyncClient):
                 # child_key = child.key()
                 
                 if child['type'] == 'folder':
-                    var = await setup_folder(child, folder_node, child_key)
+                    child = await setup_folder(child, folder_node, child_key, delete_if_exists=delete_if_exists)
                     self.logger.info(f'Folder {child_key} added to object {object_name}')
                 else:
                     existing_var = False
                     if existing_obj and not delete_if_exists:
-                        child_node = [child for child in folder_node.get_children() if child.get_browse_name().Name == child_key]
-                        if child_node[0]:
+                        child_node = [node for node in await folder_node.get_children() if (await node.read_browse_name()).Name == child_key]
+                        if child_node:
                             child['node'] = child_node[0]
                             existing_var = True
                             self.logger.info(f'Variable {child_key} retrieved from object {object_name}')
@@ -522,7 +1005,7 @@ class uaclient_librescada(asyncClient):
         # Create object in opc server
         existing_obj, _ = await self.check_object_in_server(object_name)
         
-        object_node = await self.setup_objects(object_name=object_name, delete_if_exists=delete_if_exists)
+        object_node, _, _ = await self.setup_objects(object_name=object_name, delete_if_exists=delete_if_exists)
         object_config['node'] = object_node
         
         # Retrieve online node
@@ -536,7 +1019,7 @@ class uaclient_librescada(asyncClient):
             child = object_config['children'][child_key]
             # child_key = child.key()
             if child['type'] == 'folder':
-                child = await setup_folder(child, object_node, child_key)
+                child = await setup_folder(child, object_node, child_key, delete_if_exists=delete_if_exists)
             else:
                 existing_var = False
                 if existing_obj and not delete_if_exists:
@@ -565,6 +1048,7 @@ class uaclient_librescada(asyncClient):
         
         return nodes
     
+    @timed('opc_find_nodes', batch_arg='var_list', client='uaclient_librescada')
     async def find_nodes(self, var_list:list, object='', folder='', log=True):
         """ Function that looks for a node in all or specific objects
             in a OPC server. Async version 
@@ -575,9 +1059,7 @@ class uaclient_librescada(asyncClient):
             object: name of the object to look in, if empty, all objects are searched
             folder: name of the folder to look in, if empty, all folders are searched
             
-            AVISO. Esta función es terrible y está programada por un mono. En algún momento
-                   hay que darle una pensada o estudiar la librería si hay mejores formas de
-                   hacerlo
+            Lookups are resolved through a server_structure_index built once per structure
                 
         """
         if not self.server_structure:
@@ -589,85 +1071,53 @@ class uaclient_librescada(asyncClient):
         if object:
             if object not in self.server_structure:
                 # First try updating the server structure
-                self.server_structure = await self.get_server_structure()
+                self.server_structure = await self.get_server_structure(refresh=True)
                 if object not in self.server_structure:
                     raise RuntimeError(f'Object {object} not found in server')
             
             if folder:
+                if folder not in self.server_structure[object]['children'] and not self.structure_refreshed:
+                    self.server_structure = await self.get_server_structure(refresh=True)
                 if folder not in self.server_structure[object]['children']:
                     raise RuntimeError(f'Folder {folder} not found in object {object}')
-                else: objects = [self.server_structure[object]]
             elif var_list[0] == object:
                 return [self.server_structure[object]]
-            else: # Con esto, si hay nodos con el mismo nombre en varios objetos se coge el primero, si se especifica un objeto es porque se quiere que se busque sólo en ese objeto
-                # objects = self.server_structure
-                
-                # Alternativa
-                objects = {object: self.server_structure[object]}
-        else:
-            objects = self.server_structure
+            
             if log: self.logger.info(f'Object {object} specified, looking only in that object')
             
-        # Make sure it is a list
-        # if not isinstance(objects, list): objects = [objects]
-        # Find the nodes in the list of objs
-        var_nodes = []
-        for var_name in var_list:
-            nodeNotFound = True
-
-            for obj in objects:
-                if folder:
-                    if 'children' in obj['children'][folder]:
-                        obj_children = obj['children'][folder]['children'] 
-                    else: break
-                else:
-                    obj_children = objects[obj]['children']
-                    
-                if var_name in obj_children:
-                    var_nodes.append(obj_children[var_name]['node'])
-                    nodeNotFound = False
-                    break
-                else:
-                    for obj_children_child in obj_children:
-                        if 'children' in obj_children[obj_children_child]: # Folder
-                            if var_name in obj_children[obj_children_child]['children']:
-                                var_nodes.append(obj_children[obj_children_child]['children'][var_name]['node'])
-                                nodeNotFound = False
-                                break
-
-                    # Node not found in this object
-        
-            if nodeNotFound:
-                var_nodes.append([])
-                self.logger.info(f'Node for variable {var_name} could not be found on server')
-
-        return var_nodes
+        nodes = get_structure_index(self.server_structure).find_nodes(var_list, object=object, folder=folder)
+        if not all(nodes) and not self.structure_refreshed:
+            # The cache can miss variables added to the server, browse it once before giving up
+            if log: self.logger.info('Variables not found in the cached server structure, browsing server')
+            self.server_structure = await self.get_server_structure(refresh=True)
+            return await self.find_nodes(var_list, object=object, folder=folder, log=log)
             
+        return nodes
+            
+    @timed('opc_read_values', batch_arg='nodes', client='uaclient_librescada')
     async def read_values(self, nodes:list, datavalue=False):
         """
             Read the value of multiple nodes in one ua call with the option 
-            to include additional information.
+            to include additional information. Nodes are read in chunks of
+            MaxNodesPerRead, invalid nodes or nodes with a bad status are
+            returned as None.
         """
         
+        results = await read_datavalues(self, nodes)
+        
         if datavalue:
-            return [(await self.get_node(node).read_value()).Value for node in nodes]            
+            return results
         else:
-            values = []
-            for node in nodes:
-                try:
-                    value = await self.get_node(node).read_value()
-                except Exception:
-                    value = None
-                values.append(value)
-            
-            return values
+            return [result.Value.Value if result is not None else None for result in results]
         
+    @timed('opc_write_values', batch_arg='nodes', client='uaclient_librescada')
     async def write_values(self, nodes:list, values:list):
         """
-            Write values to multiple nodes in one ua call
+            Write values to multiple nodes in one ua call (one per chunk of
+            MaxNodesPerWrite nodes). Returns a list of status codes aligned with nodes
         """
         
-        return [await self.get_node(node).write_value(dv) for node, dv in zip(nodes, values)]
+        return await write_datavalues(self, nodes, values)
     
     async def write_float_value(self, var, value):
         dv = ua.DataValue(
@@ -700,6 +1150,99 @@ class uaclient_librescada(asyncClient):
             
         return objects
     
+    async def subscribe_groups(self, groups:list, publishing_interval=1000, sampling_interval=None, 
+                               deadband=None, deadband_type=ua.DeadbandType.Absolute, queuesize=0, maxLen=None):
+        """
+            Alternative to polling groups with read_values / async_readValuesUA. One 
+            subscription is created per group (as generated by generate_groups) and the
+            data change notifications are appended directly to the values, source_time 
+            and server_time buffers of each variable in group['measurements'], or to the 
+            group ring buffer if it has one (see group_subscription_handler).
+            
+            Every parameter can be overridden per group by including a key with 
+            the same name in the group dictionary.
+
+        Args:
+            groups (list): Groups, if they have an opcTag_list it is used, otherwise the nodes 
+                           are found from sensorId_list (in inputs for the inputs group, 
+                           in measurements otherwise, as opcua_server_configuration)
+            publishing_interval (int, optional): Publishing interval in ms. Defaults to 1000.
+            sampling_interval (int, optional): Sampling interval in ms. Defaults to the publishing interval.
+            deadband (float, optional): Only notify changes larger than the deadband. Defaults to None.
+                                        With a deadband, the sampling interval is chosen by the server.
+            deadband_type (ua.DeadbandType, optional): Absolute or Percent. Defaults to Absolute.
+            queuesize (int, optional): Server queue size for each monitored item. Defaults to 0.
+            maxLen (int, optional): Length of the buffers if they don't exist yet. Defaults to None.
+
+        Returns:
+            dict: Subscriptions by group name
+        """
+        
+        for group in groups:
+            if group['name'] in self.subscriptions:
+                await self.unsubscribe_groups([group['name']])
+                
+            if not group.get('opcTag_list'):
+                object = 'inputs' if group['name'] == 'inputs' else 'measurements'
+                group['opcTag_list'] = await self.find_nodes(group['sensorId_list'], object=object, log=False)
+            
+            handler = group_subscription_handler(group, maxLen=maxLen)
+            nodes, var_ids = [], []
+            for var_id, node in zip(group['varId_list'], group['opcTag_list']):
+                nodeid = to_nodeid(node)
+                if nodeid is None:
+                    self.logger.warning(f'Variable {var_id} of group {group["name"]} has no node, not subscribed')
+                    continue
+                
+                handler.var_ids[nodeid] = var_id
+                nodes.append(self.get_node(nodeid))
+                var_ids.append(var_id)
+                
+            if not nodes:
+                self.logger.warning(f'No nodes to subscribe for group {group["name"]}')
+                continue
+            
+            group_publishing_interval = group.get('publishing_interval', publishing_interval)
+            group_sampling_interval = group.get('sampling_interval', sampling_interval)
+            group_deadband = group.get('deadband', deadband)
+            
+            subscription = await self.create_subscription(group_publishing_interval, handler)
+            if group_deadband:
+                results = await subscription.deadband_monitor(nodes, group_deadband, 
+                                                              deadbandtype=group.get('deadband_type', deadband_type),
+                                                              queuesize=group.get('queuesize', queuesize))
+            else:
+                results = await subscription.subscribe_data_change(nodes, queuesize=group.get('queuesize', queuesize),
+                                                                   sampling_interval=group_sampling_interval if group_sampling_interval is not None 
+                                                                                     else group_publishing_interval)
+            
+            # Monitored items that could not be created return a StatusCode instead of a handle
+            failed = [(var_id, result) for var_id, result in zip(var_ids, results) if isinstance(result, ua.StatusCode)]
+            for var_id, status in failed:
+                self.logger.warning(f'Variable {var_id} of group {group["name"]} could not be subscribed: {status.name}')
+            
+            self.subscriptions[group['name']] = subscription
+            self.logger.info(f'Subscribed to {len(nodes)-len(failed)} of {len(nodes)} variables of group {group["name"]} '
+                             f'(publishing interval: {group_publishing_interval} ms)')
+            
+        return self.subscriptions
+    
+    async def unsubscribe_groups(self, group_names:list=None):
+        """ Delete the subscriptions of the given groups, all of them if not specified """
+        
+        if group_names is None:
+            group_names = list(self.subscriptions.keys())
+            
+        for group_name in group_names:
+            subscription = self.subscriptions.pop(group_name, None)
+            if subscription is None:
+                continue
+            
+            try:
+                await subscription.delete()
+            except Exception as e:
+                self.logger.warning(f'Error deleting subscription of group {group_name}: {e}')
+    
 async def get_control_loop(opc_client, controller_name, node_structure=None):
     controller_node = findNodes_sync(opc_client=opc_client, var_list=[controller_name], 
                                      object='controllers', node_structure=node_structure)
@@ -714,20 +1257,16 @@ async def get_control_loop(opc_client, controller_name, node_structure=None):
     return controller_vars
 
 class async_extendedClient(asyncClient):
+    @timed('opc_read_values', batch_arg='nodes', client='async_extendedClient')
     async def read_values(self, nodes, datavalue=False):
         """
         Read the value of multiple nodes in one ua call with the option 
         to include additional information.
         """
-        results = [];
         if isinstance(nodes, Node):
-            results.append(await nodes.read_attribute(ua.AttributeIds.Value))
-        else:
-            for node in nodes:
-                if isinstance(node, Node):
-                    results.append(await node.read_attribute(ua.AttributeIds.Value))
-                else:
-                    results.append(None)
+            nodes = [nodes]
+        
+        results = await read_datavalues(self, [node if isinstance(node, Node) else None for node in nodes])
             
         if datavalue: # Return a list of datavalue objects
             return results
@@ -755,39 +1294,29 @@ class async_extendedClient(asyncClient):
             return values
             # return [(await self.get_node(node).read_value()) for node in nodes]
     
+    @timed('opc_write_values', batch_arg='nodes', client='async_extendedClient')
     async def write_values(self, nodes, values):
         """
-        Write values to multiple nodes in one ua call
+        Write values to multiple nodes in one ua call (one per chunk of
+        MaxNodesPerWrite nodes). Returns a list of status codes aligned with nodes
         """
         
-        return [await self.get_node(node).write_value(dv) for node, dv in zip(nodes, values)]
+        return await write_datavalues(self, nodes, values)
                 
 class extendedClient(syncClient):
+    @timed('opc_read_values', batch_arg='nodes', client='extendedClient')
     def read_values(self, nodes, datavalue=False):
         """
         Read the value of multiple nodes in one ua call with the option 
         to include additional information.
         """
         
-        results = [];
-        # One node object
-        if isinstance(nodes, SyncNode):
-            results.append(nodes.read_attribute(ua.AttributeIds.Value))
-        # One node string
-        elif isinstance(nodes, str):
-            results.append(self.get_node(nodes).read_attribute(ua.AttributeIds.Value))
-        else:
-            # Multiple node objects or strings
-            for node in nodes:
-                if isinstance(node, SyncNode):
-                    results.append(node.read_attribute(ua.AttributeIds.Value))
-                elif isinstance(node, str):
-                    if node:
-                        results.append(self.get_node(node).read_attribute(ua.AttributeIds.Value))
-                    else:
-                        results.append(None)
-                else:
-                    results.append(None)
+        # One node object or string
+        if isinstance(nodes, (SyncNode, str)):
+            nodes = [nodes]
+        
+        # Multiple node objects or strings, read in as few calls as possible
+        results = self.tloop.post(read_datavalues(self.aio_obj, nodes))
             
         if datavalue: # Return a list of datavalue objects
             return results
@@ -806,29 +1335,35 @@ class async_extendedServer(asyncServer):
     #         return ua.DataValue(val, SourceTimestamp=datetime.datetime.utcnow())
     #     return ua.DataValue(ua.Variant(val, varianttype), SourceTimestamp=datetime.datetime.utcnow())
 
+    @timed('opc_write_values', batch_arg='nodes', client='async_extendedServer')
     async def write_values(self, nodes, values):
-            """
-            Write values to multiple nodes in one ua call
-            """
-            # nodeids = [node.nodeid for node in nodes]
-            
-            # if isinstance(values[0], ua.DataValue):
-            #     dvs = values
-            # else:
-            #     dvs = [self.value_to_datavalue(val) for val in values]
-            for node, dv in zip(nodes, values):
-                node = self.get_node(node)
-                name = await node.read_browse_name()
-                print(f'{name}: {dv}')
-                result = await node.write_value(dv)
-                print(result)
-            results = [await node.write_value(dv) for node, dv in zip(nodes, values)]
-            # result = await self.write_attribute_value(nodeids[0], dvs[0], ua.AttributeIds.Value)
-            # print(result)
-            # pprint(dvs[1])
-            # [await self.write_attribute_value(nodeid, dv, ua.AttributeIds.Value) for nodeid, dv in zip(nodeids, dvs)]
-            # for result in results:
-            # print(results[0].check())
+        """
+        Write values to multiple nodes in one call to the internal session.
+        Returns a list of status codes aligned with nodes
+        """
+        if len(nodes) != len(values):
+            raise ValueError(f'Number of nodes ({len(nodes)}) and values ({len(values)}) do not match')
+        
+        nodeids = [to_nodeid(node) for node in nodes]
+        results = [ua.StatusCode(ua.StatusCodes.BadNodeIdInvalid)] * len(nodeids)
+        
+        params = ua.WriteParameters()
+        valid_idxs = []
+        for idx, (nodeid, value) in enumerate(zip(nodeids, values)):
+            if nodeid is None:
+                continue
+            params.NodesToWrite.append(ua.WriteValue(NodeId=nodeid, AttributeId=ua.AttributeIds.Value, 
+                                                     Value=value_to_datavalue(value)))
+            valid_idxs.append(idx)
+        
+        if valid_idxs:
+            status_codes = await self.iserver.isession.write(params)
+            for idx, status_code in zip(valid_idxs, status_codes):
+                results[idx] = status_code
+                if not status_code.is_good():
+                    logger.warning(f'Bad status writing node {nodeids[idx].to_string()}: {status_code}')
+        
+        return results
 
 async def write_float_opc(var, value):
     dv = ua.DataValue(
@@ -862,11 +1397,14 @@ def readValuesUA(client, group, initial_read=False, log=True):
     if group['opcTag_list'][0]:
         try:
             values = client.read_values(group['opcTag_list'], datavalue=False)
-            # print(group['opcTag_list'])
-            for idx in range(len(group["measurements"].keys())):
-                # pprint(values[idx].Value)
-                group["measurements"][group["varId_list"][idx]]["values"].append(values[idx])
-                group["measurements"][group["varId_list"][idx]]["time"].append(datetime.datetime.now(tz=datetime.timezone.utc))
+            
+            if 'buffer' in group: # Columnar ring buffer, one write for the whole group
+                group['buffer'].append(values)
+            else:
+                now = datetime.datetime.now(tz=datetime.timezone.utc)
+                for idx in range(len(group["measurements"].keys())):
+                    group["measurements"][group["varId_list"][idx]]["values"].append(values[idx])
+                    group["measurements"][group["varId_list"][idx]]["time"].append(now)
                 # group["measurements"][group["varId_list"][idx]]["values"].append(values[idx].Value.Value)
                 # group["measurements"][group["varId_list"][idx]]["time"].append(values[idx].SourceTimestamp)
                 # if initial_read: logger.info(f'Tag {group["name"]} - {group["sensorId_list"][idx]}: {values[idx]}')
@@ -899,19 +1437,24 @@ async def async_readValuesUA(client, group, initial_read=False, consisting_serve
 
     # try:
     values = await client.read_values(group['opcTag_list'], datavalue=True)
-    for idx in range(len(group["measurements"].keys())):
-        if values[idx] is not None:
-            # pprint(f'Leído valor: {values[idx].Value.Value} con tiempo {values[idx].SourceTimestamp}')
-            group["measurements"][group["varId_list"][idx]]["values"].append(values[idx].Value.Value)
-            group["measurements"][group["varId_list"][idx]]["source_time"].append(values[idx].SourceTimestamp)
-            group["measurements"][group["varId_list"][idx]]["server_time"].append(values[idx].ServerTimestamp)
-        else:
-            group["measurements"][group["varId_list"][idx]]["values"].append(nan)
-            group["measurements"][group["varId_list"][idx]]["source_time"].append(datetime.datetime.now(tz=datetime.timezone.utc))
-            group["measurements"][group["varId_list"][idx]]["server_time"].append(datetime.datetime.now(tz=datetime.timezone.utc))
+    now = datetime.datetime.now(tz=datetime.timezone.utc)
+    
+    if 'buffer' in group: # Columnar ring buffer, one write for the whole group
+        group['buffer'].append([value.Value.Value if value is not None else None for value in values])
+    else:
+        for idx in range(len(group["measurements"].keys())):
+            if values[idx] is not None:
+                # pprint(f'Leído valor: {values[idx].Value.Value} con tiempo {values[idx].SourceTimestamp}')
+                group["measurements"][group["varId_list"][idx]]["values"].append(values[idx].Value.Value)
+                group["measurements"][group["varId_list"][idx]]["source_time"].append(values[idx].SourceTimestamp)
+                group["measurements"][group["varId_list"][idx]]["server_time"].append(values[idx].ServerTimestamp)
+            else:
+                group["measurements"][group["varId_list"][idx]]["values"].append(float('nan'))
+                group["measurements"][group["varId_list"][idx]]["source_time"].append(now)
+                group["measurements"][group["varId_list"][idx]]["server_time"].append(now)
             
     if consisting_server_time:
-        group["time"].append(datetime.datetime.now(tz=datetime.timezone.utc))
+        group["time"].append(now)
         # if initial_read: logger.info(f'Tag {group["name"]} - {group["sensorId_list"][idx]}: {values[idx]}')
             
     # except Exception as e:
@@ -919,16 +1462,289 @@ async def async_readValuesUA(client, group, initial_read=False, consisting_serve
 
     return group
 
-# class SubscriptionHandler:
-#     """
-#     The SubscriptionHandler is used to handle the data that is received for the subscription.
-#     """
-#     def datachange_notification(self, node: Node, val, data):
-#         """
-#         Callback for asyncua Subscription.
-#         This method will be called when the Client received a data change message from the Server.
-#         """
-#         logger.info('datachange_notification %r %s', node, val)
+class group_subscription_handler():
+    """
+    Handler used by uaclient_librescada.subscribe_groups. Values received in 
+    data change notifications are appended to the buffers of the variables in the group.
+    
+    If the group has a ring buffer (ring_buffer in the monitoring configuration), 
+    it holds one row per read of the whole group instead. The notifications of 
+    a publish are merged in one row with the latest value of every variable, 
+    timestamped with the newest source timestamp.
+    """
+    
+    def __init__(self, group:dict, maxLen=None):
+        self.group = group
+        self.var_ids = {} # nodeid -> var_id
+        
+        self.buffer = group.get('buffer')
+        if self.buffer is not None:
+            self._row = self.buffer.last() # Latest value of every variable
+            self._row_time = None # Newest source timestamp of the pending row
+            return
+        
+        # Make sure every variable has its buffers
+        for var_id in group['measurements']:
+            for field in ['values', 'source_time', 'server_time']:
+                if field not in group['measurements'][var_id]:
+                    group['measurements'][var_id][field] = deque(maxlen=maxLen)
+        
+    def datachange_notification(self, node: Node, val, data):
+        """
+        Callback for asyncua Subscription.
+        This method will be called when the Client received a data change message from the Server.
+        """
+        var_id = self.var_ids.get(node.nodeid)
+        if var_id is None:
+            return
+        
+        dv = data.monitored_item.Value
+        now = datetime.datetime.now(tz=datetime.timezone.utc)
+        
+        if self.buffer is not None:
+            self._row[var_id] = val if dv.StatusCode.is_good() else None
+            source_time = dv.SourceTimestamp or now
+            if self._row_time is None:
+                # Written once the rest of the notifications of the publish are handled
+                asyncio.get_running_loop().call_soon(self._append_row)
+                self._row_time = source_time
+            else:
+                self._row_time = max(self._row_time, source_time)
+            return
+        
+        measurement = self.group['measurements'][var_id]
+        if dv.StatusCode.is_good():
+            measurement['values'].append(val)
+        else:
+            measurement['values'].append(float('nan'))
+        measurement['source_time'].append(dv.SourceTimestamp or now)
+        measurement['server_time'].append(dv.ServerTimestamp or now)
+        
+    def _append_row(self):
+        row_time = self._row_time
+        if row_time.tzinfo is None: # asyncua returns naive UTC timestamps
+            row_time = row_time.replace(tzinfo=datetime.timezone.utc)
+        
+        self.buffer.append([self._row[var_id] for var_id in self.buffer.var_ids], 
+                           time_ns=int(row_time.timestamp() * 1e9))
+        self._row_time = None
+        
+    def status_change_notification(self, status):
+        logger.warning(f'Subscription status change for group {self.group["name"]}: {status}')
+        
+
+class group_poller():
+    """
+    Polls every group (as generated by generate_groups) in its own task, so a slow 
+    group does not delay the rest. Each group is read on a grid of the monotonic 
+    clock, at phase + k*period seconds from the start of the poller, with one 
+    read_values call for all its tags per tick (async_readValuesUA for asyncio 
+    clients, readValuesUA in a thread for sync clients).
+    
+    A cycle that takes longer than the period is an overrun, and the ticks that 
+    passed meanwhile are missed. With policy 'skip' they are dropped and polling 
+    resumes at the next tick of the grid, with 'coalesce' a single read is done 
+    right away for all of them and then it resumes on the grid.
+    
+    period, phase and policy can be overridden per group by including a key with 
+    the same name in the group dictionary.
+    
+    Example:
+        poller = group_poller(opc_client, groups, period=1, on_read=process_group)
+        poller.start()
+        ...
+        print(poller.stats())
+        await poller.stop()
+    """
+    
+    policies = ['skip', 'coalesce']
+    
+    def __init__(self, client, groups:list, period:float=1.0, phase:float=0.0, policy:str='skip', 
+                 read=None, on_read=None, stats_window:int=1000):
+        """
+        Args:
+            client: OPC UA client, asyncio (e.g. uaclient_librescada) or sync (extendedClient)
+            groups (list): Groups to poll
+            period (float, optional): Seconds between reads of a group. Defaults to 1.0.
+            phase (float, optional): Offset in seconds of the grid of a group, used to spread 
+                                     the reads of groups with the same period. Defaults to 0.0.
+            policy (str, optional): What to do with missed ticks, 'skip' or 'coalesce'. Defaults to 'skip'.
+            read (callable, optional): read(client, group), function or coroutine function that 
+                                       reads a group. Defaults to async_readValuesUA / readValuesUA.
+            on_read (callable, optional): on_read(group), function or coroutine function called 
+                                          after every successful read of a group. Defaults to None.
+            stats_window (int, optional): Number of cycle times kept per group for the percentiles. Defaults to 1000.
+        """
+        
+        self.client = client
+        self.groups = groups
+        self.on_read = on_read
+        
+        if read is None:
+            read = async_readValuesUA if inspect.iscoroutinefunction(client.read_values) else readValuesUA
+        self.read = read
+        
+        self.schedule = {}
+        for group in groups:
+            group_period = group.get('period', period)
+            group_policy = group.get('policy', policy)
+            if group_period <= 0:
+                raise ValueError(f'Period of group {group["name"]} must be positive, got {group_period}')
+            if group_policy not in self.policies:
+                raise ValueError(f'Policy {group_policy} of group {group["name"]} not supported, options are: {self.policies}')
+            self.schedule[group['name']] = {'period': group_period, 'phase': group.get('phase', phase) % group_period, 
+                                            'policy': group_policy}
+        
+        self.stats_window = stats_window
+        self._stats = {group['name']: self._new_stats() for group in groups}
+        self._tasks = {}
+        self._start = None
+        
+    def _new_stats(self) -> dict:
+        return {'cycles': 0, 'errors': 0, 'overruns': 0, 'missed_ticks': 0, 'coalesced_reads': 0, 
+                'last_s': None, 'min_s': None, 'max_s': None, 'sum_s': 0.0, 'max_lateness_s': 0.0,
+                'recent': deque(maxlen=self.stats_window)}
+        
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks.values())
+        
+    def start(self):
+        """ Start a task per group in the running event loop """
+        
+        if self.running:
+            raise RuntimeError('Poller already running')
+        
+        self._start = time.monotonic()
+        self._tasks = {group['name']: asyncio.create_task(self._poll_group(group), name=f'poll_{group["name"]}')
+                       for group in self.groups}
+        
+        logger.info(f'Polling {len(self.groups)} groups: ' + 
+                    ', '.join(f'{name} every {sched["period"]} s' for name, sched in self.schedule.items()))
+        
+    async def stop(self):
+        """ Cancel the tasks and wait for them to finish """
+        
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks = {}
+        
+    async def run(self, duration:float=None):
+        """ Poll until cancelled, or for duration seconds if given """
+        
+        self.start()
+        try:
+            if duration is None:
+                await asyncio.gather(*self._tasks.values())
+            else:
+                await asyncio.sleep(duration)
+        finally:
+            await self.stop()
+            
+    async def __aenter__(self):
+        self.start()
+        return self
+    
+    async def __aexit__(self, *exc):
+        await self.stop()
+        
+    async def _read_group(self, group):
+        if inspect.iscoroutinefunction(self.read):
+            await self.read(self.client, group)
+        else:
+            await asyncio.to_thread(self.read, self.client, group)
+            
+        if self.on_read is not None:
+            result = self.on_read(group)
+            if inspect.isawaitable(result):
+                await result
+        
+    async def _poll_group(self, group):
+        name = group['name']
+        period, phase, policy = self.schedule[name]['period'], self.schedule[name]['phase'], self.schedule[name]['policy']
+        stats = self._stats[name]
+        
+        tick = 0 # Index in the grid of the tick being read
+        catch_up = False
+        while True:
+            if catch_up: # Coalesced read of the missed ticks, straight away
+                deadline = time.monotonic()
+            else:
+                deadline = self._start + phase + tick*period
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            
+            start = time.monotonic()
+            stats['max_lateness_s'] = max(stats['max_lateness_s'], start - deadline)
+            try:
+                await self._read_group(group)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                stats['errors'] += 1
+                logger.error(f'Error polling group {name}: {e}')
+            end = time.monotonic()
+            self._record_cycle(name, stats, end - start)
+            
+            # First tick of the grid after the cycle, the ones in between were missed
+            next_tick = math.floor((end - self._start - phase) / period) + 1
+            missed = next_tick - tick - 1
+            catch_up = missed > 0 and policy == 'coalesce'
+            if missed > 0:
+                stats['overruns'] += 1
+                stats['missed_ticks'] += missed
+                if registry.enabled:
+                    registry.inc('opc_poll_overruns_total', help='Polling cycles longer than the period', group=name)
+                    registry.inc('opc_poll_missed_ticks_total', missed, help='Polling ticks missed by overruns', group=name)
+                logger.warning(f'Overrun polling group {name}: cycle took {end - start:.3f} s (period {period} s), '
+                               f'{missed} ticks {"coalesced" if catch_up else "skipped"}')
+            
+            if catch_up:
+                stats['coalesced_reads'] += 1
+                tick = next_tick - 1 # The catch-up read stands for the last missed tick
+            else:
+                tick = next_tick
+            
+    def _record_cycle(self, name, stats, cycle_time):
+        stats['cycles'] += 1
+        stats['last_s'] = cycle_time
+        stats['sum_s'] += cycle_time
+        stats['min_s'] = cycle_time if stats['min_s'] is None else min(stats['min_s'], cycle_time)
+        stats['max_s'] = cycle_time if stats['max_s'] is None else max(stats['max_s'], cycle_time)
+        stats['recent'].append(cycle_time)
+        
+        if registry.enabled:
+            registry.observe('opc_poll_cycle_seconds', cycle_time, help='Time to read a polled group', group=name)
+            
+    def stats(self) -> dict:
+        """
+        Cycle time statistics of every group, times in seconds:
+            cycles, errors, overruns, missed_ticks, coalesced_reads, last, min, max, 
+            mean, p50, p95 (over the last stats_window cycles), max_lateness (delay 
+            of the start of a read from its tick) and period
+        """
+        
+        stats = {}
+        for name, group_stats in self._stats.items():
+            recent = sorted(group_stats['recent'])
+            percentile = lambda q: recent[min(len(recent) - 1, int(q * len(recent)))] if recent else None
+            stats[name] = {
+                'cycles': group_stats['cycles'], 'errors': group_stats['errors'], 
+                'overruns': group_stats['overruns'], 'missed_ticks': group_stats['missed_ticks'],
+                'coalesced_reads': group_stats['coalesced_reads'],
+                'last_s': group_stats['last_s'], 'min_s': group_stats['min_s'], 'max_s': group_stats['max_s'],
+                'mean_s': group_stats['sum_s'] / group_stats['cycles'] if group_stats['cycles'] else None,
+                'p50_s': percentile(0.5), 'p95_s': percentile(0.95),
+                'max_lateness_s': group_stats['max_lateness_s'], 'period_s': self.schedule[name]['period'],
+            }
+            
+        return stats
+    
+    def reset_stats(self):
+        for group_stats in self._stats.values(): # In place, the tasks keep a reference
+            group_stats.update(self._new_stats())
         
 
 async def setup_objects(server, idx, type='gateway', object_name=None):
@@ -1040,10 +1856,10 @@ def readValuesDA(client, group, initial_read=False):
 
             varIdx = 0
             # for name, value, quality, time in client.iread(group["opcTag_list"], timeout=10, group=group["name"]):
-            for name, value, quality, time in client.iread(group["opcTag_list"], timeout=10, group=group["name"]):
+            for name, value, quality, timestamp in client.iread(group["opcTag_list"], timeout=10, group=group["name"]):
                 # print(f'Tag {group["name"]} - {group["sensorId_list"][varIdx]}: {value}')
                 if value is not None: group["measurements"][group["varId_list"][varIdx]]["values"].append(value)
-                if time is not None:  group["measurements"][group["varId_list"][varIdx]]["time"].append(time)
+                if timestamp is not None:  group["measurements"][group["varId_list"][varIdx]]["time"].append(timestamp)
                 
                 varIdx += 1
         except Exception:
@@ -1056,19 +1872,19 @@ def readValuesDA(client, group, initial_read=False):
             # initial_read = True
             logger.warning(f'OPC Server error, reconnecting: {e}')
             client.connect(config['servidor']['server'], config['servidor']['host'])
-            for name, value, quality, time in client.iread(group["opcTag_list"], timeout=10, group=group["name"]):
+            for name, value, quality, timestamp in client.iread(group["opcTag_list"], timeout=10, group=group["name"]):
                 # print(f'Tag {group["name"]} - {group["sensorId_list"][varIdx]}: {value}')
                 if value is not None: group["measurements"][group["varId_list"][varIdx]]["values"].append(value)
-                if time is not None:  group["measurements"][group["varId_list"][varIdx]]["time"].append(time)
+                if timestamp is not None:  group["measurements"][group["varId_list"][varIdx]]["time"].append(timestamp)
                 
                 varIdx += 1
                 
         else:
            
-            for name, value, quality, time in client.iread(group=group["name"], timeout=10):
+            for name, value, quality, timestamp in client.iread(group=group["name"], timeout=10):
                 print(f'Tag {group["name"]} - {group["sensorId_list"][varIdx]}: {value}')
                 if value is not None: group["measurements"][group["varId_list"][varIdx]]["values"].append(value)
-                if time is not None:  group["measurements"][group["varId_list"][varIdx]]["time"].append(time)
+                if timestamp is not None:  group["measurements"][group["varId_list"][varIdx]]["time"].append(timestamp)
                 
                 varIdx += 1
         # except Exception:
@@ -1144,6 +1960,7 @@ def findNode(opc_client, varToFind):
         logger.info(f'Node found for {varToFind}: {varNode}')
         return varNode
     
+@timed('opc_find_nodes', batch_arg='var_list', client='sync')
 def findNodes_sync(opc_client, var_list, object='', folder='', node_structure=[], log=True):
     """ Function that looks for a node in all or specific objects
         in a OPC server. Async version 
@@ -1175,49 +1992,8 @@ def findNodes_sync(opc_client, var_list, object='', folder='', node_structure=[]
                     raise RuntimeError(f'Folder {folder} not found in object {object}')
             elif var_list[0] == object:
                 return [server_structure[object]]
-            else: # Con esto, si hay nodos con el mismo nombre en varios objetos se coge el primero, si se especifica un objeto es porque se quiere que se busque sólo en ese objeto
-                # objects = server_structure
-                
-                # Alternativa
-                objects = {object: server_structure[object]}
-    else:
-        objects = server_structure
          
-    # Make sure it is a list
-    # if not isinstance(objects, list): objects = [objects]
-    # Find the nodes in the list of objs
-    var_nodes = []
-    for var_name in var_list:
-        nodeNotFound = True
-
-        if folder:
-            obj_children = objects['children'][folder]['children']
-            if var_name in obj_children:
-                var_nodes.append(obj_children[var_name]['node'])
-                nodeNotFound = False
-        else:
-            for obj in objects:
-                obj_children = objects[obj]['children']
-                    
-                if var_name in obj_children:
-                    var_nodes.append(obj_children[var_name]['node'])
-                    nodeNotFound = False
-                    break
-                else:
-                    for obj_children_child in obj_children:
-                        if 'children' in obj_children[obj_children_child]: # Folder
-                            if var_name in obj_children[obj_children_child]['children']:
-                                var_nodes.append(obj_children[obj_children_child]['children'][var_name]['node'])
-                                nodeNotFound = False
-                                break
-
-                    # Node not found in this object
-        
-        if nodeNotFound:
-            var_nodes.append([])
-            logger.info(f'Node for variable {var_name} could not be found on server')
-
-    return var_nodes
+    return get_structure_index(server_structure).find_nodes(var_list, object=object, folder=folder)
 
 async def check_object_in_server(opc_client, object_name):
     """ Function that checks if an object exists in the server """
@@ -1254,9 +2030,13 @@ async def check_folder_in_server(opc_client, object_name, folder_name):
     
     return False, []
 
-def get_server_structure_sync(opc_client, log=False):
+@timed('opc_get_server_structure', client='sync')
+def get_server_structure_sync(opc_client, log=False, url=None, uri=None, cache_dir=None, version_nodeid=None, refresh=False, 
+                              return_browsed=False):
         
     """ Function that returns the structure of the server in a dictionary.
+    - If url and uri are provided, the structure is cached on disk (see get_cached_tree), 
+      refresh=True ignores the cache. With return_browsed, (structure, browsed) is returned
     - Duplicates IDs are allowed as long as not within the same tree level
     - Three levels of hierarchy are supported (user_object - folder - variable)
     - Structure expected for the OPC server: 
@@ -1315,32 +2095,19 @@ def get_server_structure_sync(opc_client, log=False):
                         - output_id: FT-AQU-101a (string)
     """
     
-    object_nodes = opc_client.nodes.objects.get_children()
-
-    objs = {}
-    
-    for obj in object_nodes:
-        name = obj.read_browse_name()
-        if name.Name != 'Server' and name.Name != 'Aliases':
-            objs[name.Name] = {'name':name.Name, 'node':obj}
-        
-    for obj in objs:     # Look in each object or the one specfied (measurements, inputs, controllers, etc)
-        obj_children = objs[obj]['node'].get_children()
-        objs[obj]['children'] = {}
-        for obj_child in obj_children:
-            obj_child_name = obj_child.read_browse_name()
-            objs[obj]['children'][obj_child_name.Name] = {'name':obj_child_name.Name, 'node':obj_child}
-            
-            obj_child_children = obj_child.get_children()
-            if len(obj_child_children)>0: # Folder
-                objs[obj]['children'][obj_child_name.Name]['children'] = {}
-                for obj_child_child in obj_child_children:
-                    obj_child_child_name = obj_child_child.read_browse_name()
-                    objs[obj]['children'][obj_child_name.Name]['children'][obj_child_child_name.Name] = {'name':obj_child_child_name.Name, 'node':obj_child_child}                
+    root_nodeid = opc_client.nodes.objects.nodeid
+    if url and uri:
+        tree, browsed = opc_client.tloop.post(get_cached_tree(opc_client.aio_obj, url, uri, cache_dir=cache_dir, 
+                                                              version_nodeid=version_nodeid, refresh=refresh, 
+                                                              return_browsed=True))
+    else:
+        tree, browsed = opc_client.tloop.post(browse_tree(opc_client.aio_obj, root_nodeid, max_depth=3)), True
+    objs = build_server_structure(tree, root_nodeid, 
+                                  lambda nodeid: SyncNode(opc_client.tloop, opc_client.aio_obj.get_node(nodeid)))
                 
     # if log: pprint(objs)
         
-    return objs
+    return (objs, browsed) if return_browsed else objs
     
 async def get_server_structure(opc_client, log=False):
         
@@ -1403,33 +2170,15 @@ async def get_server_structure(opc_client, log=False):
                         - output_id: FT-AQU-101a (string)
     """
     
-    object_nodes = await opc_client.nodes.objects.get_children()
-
-    objs = {}
-    
-    for obj in object_nodes:
-        name = await obj.read_browse_name()
-        if name.Name != 'Server' and name.Name != 'Aliases':
-            objs[name.Name] = {'name':name.Name, 'node':obj}
-        
-    for obj in objs:     # Look in each object or the one specfied (measurements, inputs, controllers, etc)
-        obj_children = await objs[obj]['node'].get_children()
-        objs[obj]['children'] = {}
-        for obj_child in obj_children:
-            obj_child_name = await obj_child.read_browse_name()
-            objs[obj]['children'][obj_child_name.Name] = {'name':obj_child_name.Name, 'node':obj_child}
-            
-            obj_child_children = await obj_child.get_children()
-            if len(obj_child_children)>0: # Folder
-                objs[obj]['children'][obj_child_name.Name]['children'] = {}
-                for obj_child_child in obj_child_children:
-                    obj_child_child_name = await obj_child_child.read_browse_name()
-                    objs[obj]['children'][obj_child_name.Name]['children'][obj_child_child_name.Name] = {'name':obj_child_child_name.Name, 'node':obj_child_child}                
+    root_nodeid = opc_client.nodes.objects.nodeid
+    tree = await browse_tree(opc_client, root_nodeid, max_depth=3)
+    objs = build_server_structure(tree, root_nodeid, opc_client.get_node)
                 
     if log: pprint(objs)
         
     return objs
         
+@timed('opc_find_nodes', batch_arg='var_list', client='async')
 async def async_findNodes(opc_client, var_list, object='', folder='', node_structure=[], log=True):
     """ Function that looks for a node in all or specific objects
         in a OPC server. Async version 
@@ -1474,52 +2223,12 @@ async def async_findNodes(opc_client, var_list, object='', folder='', node_struc
             if folder:
                 if folder not in server_structure[object]['children']:
                     raise RuntimeError(f'Folder {folder} not found in object {object}')
-                else: objects = [server_structure[object]]
             elif var_list[0] == object:
                 return [server_structure[object]]
-            else: # Con esto, si hay nodos con el mismo nombre en varios objetos se coge el primero, si se especifica un objeto es porque se quiere que se busque sólo en ese objeto
-                # objects = server_structure
-                
-                # Alternativa
-                objects = {object: server_structure[object]}
-    else:
-        objects = server_structure
+            
         if log: logger.info(f'Object {object} specified, looking only in that object')
          
-    # Make sure it is a list
-    # if not isinstance(objects, list): objects = [objects]
-    # Find the nodes in the list of objs
-    var_nodes = []
-    for var_name in var_list:
-        nodeNotFound = True
-
-        for obj in objects:
-            if folder:
-                if 'children' in obj['children'][folder]:
-                    obj_children = obj['children'][folder]['children'] 
-                else: break
-            else:
-                obj_children = objects[obj]['children']
-                
-            if var_name in obj_children:
-                var_nodes.append(obj_children[var_name]['node'])
-                nodeNotFound = False
-                break
-            else:
-                for obj_children_child in obj_children:
-                    if 'children' in obj_children[obj_children_child]: # Folder
-                        if var_name in obj_children[obj_children_child]['children']:
-                            var_nodes.append(obj_children[obj_children_child]['children'][var_name]['node'])
-                            nodeNotFound = False
-                            break
-
-                # Node not found in this object
-       
-        if nodeNotFound:
-            var_nodes.append([])
-            logger.info(f'Node for variable {var_name} could not be found on server')
-
-    return var_nodes
+    return get_structure_index(server_structure).find_nodes(var_list, object=object, folder=folder)
 
 async def async_findNode(opc_client, varToFind):
     """ Function that looks for a node in all the objects
@@ -1601,10 +2310,35 @@ def opcua_server_configuration(config, groups=[], log=True, initial_attempt=True
     # Setup OPC server
     # idx = opc_client.get_namespace_index('Servidor de prueba')
     opc_client.load_data_type_definitions()
-    node_structure = get_server_structure_sync(opc_client, log=log)
+    # Cached on disk if the server has a structure version node or if enabled, as in uaclient_librescada
+    version_node = config['ua_parameters'].get('structure_version_node')
+    cache_structure = config['ua_parameters'].get('cache_structure', version_node is not None)
+    def server_structure(refresh=False):
+        if cache_structure:
+            return get_server_structure_sync(opc_client, log=log, url=url, uri=config['ua_parameters'].get('uri'),
+                                             cache_dir=config['ua_parameters'].get('structure_cache_dir'),
+                                             version_nodeid=version_node, refresh=refresh, return_browsed=True)
+        return get_server_structure_sync(opc_client, log=log), True
+    node_structure, structure_refreshed = server_structure()
+    
+    def find_nodes(var_list, object=''):
+        """findNodes_sync, browsing the server once if something is missing from the cached structure"""
+        nonlocal node_structure, structure_refreshed
+        try:
+            nodes = findNodes_sync(opc_client=opc_client, var_list=var_list, object=object, node_structure=node_structure)
+            if all(nodes) or structure_refreshed:
+                return nodes
+        except RuntimeError: # Object not found
+            if structure_refreshed:
+                raise
+        
+        logger.info('Variables not found in the cached server structure, browsing server')
+        node_structure, structure_refreshed = server_structure(refresh=True)
+        return findNodes_sync(opc_client=opc_client, var_list=var_list, object=object, node_structure=node_structure)
     
     if role=='user':
         maxLen = config["monitoring"]["maxLen"]
+        use_ring_buffer = config["monitoring"].get("ring_buffer", False)
         
         # Create tag list for each group
         # node_structure = findNodes(opc_client=opc_client, var_list=[], return_node_structure=True)
@@ -1617,8 +2351,7 @@ def opcua_server_configuration(config, groups=[], log=True, initial_attempt=True
             else:
                 object = 'measurements'
                 
-            nodes = findNodes_sync(opc_client=opc_client, var_list=groups[grpIdx]['sensorId_list'], 
-                                   object=object, node_structure=node_structure)
+            nodes = find_nodes(groups[grpIdx]['sensorId_list'], object=object)
             # nodes = findNodes(opc_client=opc_client, var_list=groups[grpIdx]['sensorId_list'], node_structure=node_structure)
             groups[grpIdx]["opcTag_list"] = [node.__str__() if node else [] for node in nodes ] # Store string of node
             
@@ -1641,10 +2374,15 @@ def opcua_server_configuration(config, groups=[], log=True, initial_attempt=True
                 # groups[grpIdx]["opcTag_list"].append(varNode)
                 groups[grpIdx]["measurements"][var_name]["node"] = groups[grpIdx]["opcTag_list"][var_idx]
                 
-                if initial_attempt:
+                if initial_attempt and not use_ring_buffer:
                     # Add values and time fields
                     groups[grpIdx]["measurements"][var_name].update({'values':deque(maxlen=maxLen), 
                                                                 'time':deque(maxlen=maxLen)})
+            if initial_attempt and use_ring_buffer:
+                # Values and times of the whole group in a columnar buffer
+                from .buffer_utils import ring_buffer # Loads numpy, only when used
+                groups[grpIdx]['buffer'] = ring_buffer(groups[grpIdx]["varId_list"], maxLen)
+                
             if initial_attempt:
                 # Perform initial read
                 groups[grpIdx] = readValuesUA(opc_client, group=groups[grpIdx], initial_read=True)
@@ -1699,8 +2437,7 @@ def opcua_server_configuration(config, groups=[], log=True, initial_attempt=True
         for input in config['inputs']:
             input = config['inputs'][input]
             # print(input['input_id'])
-            nodes = findNodes_sync(opc_client=opc_client, var_list=[input['input_id']], 
-                                   object='inputs', node_structure=node_structure)
+            nodes = find_nodes([input['input_id']], object='inputs')
             # nodes = findNodes(opc_client=opc_client, var_list=[input['input_id']], node_structure=node_structure)
             groups[input['var_id']] = input
             groups[input['var_id']]['node'] = nodes[0].__str__() if nodes[0] else []
@@ -1730,7 +2467,7 @@ def opcua_server_configuration(config, groups=[], log=True, initial_attempt=True
                         id = config["inputs"][loop[var]]['input_id']
                         loop[field] = config['inputs'][loop[var]]
                     
-                    nodes = findNodes_sync(opc_client=opc_client, var_list=[id], node_structure=node_structure)          
+                    nodes = find_nodes([id])
                     # nodes = findNodes(opc_client=opc_client, var_list=[loop[var]], node_structure=node_structure)
                     loop[field]['node'] = nodes[0].__str__() if nodes[0] else []
                     
@@ -1746,8 +2483,7 @@ def opcua_server_configuration(config, groups=[], log=True, initial_attempt=True
                 # loop['active']['node'] = nodes[1].__str__() if nodes[1] else []
                 
                 # State variables and controller parameters
-                controller_node = findNodes_sync(opc_client=opc_client, var_list=[loop['id']], 
-                                                 object='controllers', node_structure=node_structure)
+                controller_node = find_nodes([loop['id']], object='controllers')
                 if not controller_node[0]:
                     raise RuntimeError(f'Controller {loop["id"]} not found in OPC server')
                 
@@ -1794,6 +2530,7 @@ def opcua_server_configuration(config, groups=[], log=True, initial_attempt=True
            
 async def async_opcua_server_configuration(config, groups, consisting_server_time=False):
     maxLen = config["monitoring"]["maxLen"]
+    use_ring_buffer = config["monitoring"].get("ring_buffer", False)
     
     # Connection to OPC server
     # async with Client(url=url) as opc_client:
@@ -1826,10 +2563,16 @@ async def async_opcua_server_configuration(config, groups, consisting_server_tim
             
             
             # Add values and time fields
-            groups[grpIdx]["measurements"][var_name].update({'values':deque(maxlen=maxLen), 
-                                                       'source_time':deque(maxlen=maxLen),
-                                                       'server_time':deque(maxlen=maxLen)
-                                                       })
+            if not use_ring_buffer:
+                groups[grpIdx]["measurements"][var_name].update({'values':deque(maxlen=maxLen), 
+                                                           'source_time':deque(maxlen=maxLen),
+                                                           'server_time':deque(maxlen=maxLen)
+                                                           })
+        
+        if use_ring_buffer:
+            # Values and times of the whole group in a columnar buffer
+            from .buffer_utils import ring_buffer # Loads numpy, only when used
+            groups[grpIdx]['buffer'] = ring_buffer(groups[grpIdx]["varId_list"], maxLen)
             
         if consisting_server_time: groups[grpIdx]["time"] = deque(maxlen=maxLen)
         